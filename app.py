@@ -1,47 +1,227 @@
 # app.py
 
+import time
+_import_started = time.perf_counter()
+
+import atexit
 import gradio as gr
 import json
 import logging
-from knowledge_graph import create_knowledge_graph, check_recipe_exists, get_recipe_from_kg  # Updated import
-from model_call import call_kolank_api
+import threading
+from knowledge_graph import (create_knowledge_graph, ensure_schema, get_product_from_kg,
+                             iter_recipe_ingredient_sets, add_write_listener, create_ingredient_nodes)
+from model_call import call_kolank_api, stream_kolank_api
+from partial_json import PartialJSONParser
+from recommender import RecipeRecommender, recipe_sets_from_csv, MIN_COVERAGE
+from recipe_matrix import RecipeMatrix
+from vocabulary import load_vocabulary, vocabulary_from_graph, VOCAB_PATH
+from ingredient_search import IngredientSearchIndex, SEARCH_PAGE_SIZE
+from ingredient_registry import IngredientRegistry
+from single_flight import SingleFlight
+from near_duplicates import NearDuplicateIndex
+from ingredient_pairings import PairingIndex, PAIRINGS_PATH
+from llm_cache import normalize_ingredients
+from metrics import timed, start_trace, gauge, start_metrics_server, STAGE_SECONDS
+import graph_db
+import knowledge_graph
+import model_call
 from dotenv import load_dotenv
 import os
-from neo4j import GraphDatabase
 
-from preprocessing import add_new_ingredient, load_and_preprocess_data
+from preprocessing import add_new_ingredient, load_and_preprocess_data, data_path
 
-# Initialize logger
-logging.basicConfig(level=logging.DEBUG)
+# Initialize logger; LOG_LEVEL=DEBUG adds per-request detail and stage timings
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Neo4j connection setup
-neo4j_uri = os.getenv("NEO4J_URI")
-neo4j_username = os.getenv("NEO4J_USER", "neo4j")
-neo4j_password = os.getenv("NEO4J_PASSWORD")
-print(':::::::::::::::::::::::::::::::::::::::::::',neo4j_uri, neo4j_username, neo4j_password)
-# Initialize Neo4j driver
-driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_username, neo4j_password))
+# Startup mode: "full" syncs the CSV into the graph and scans it for ingredients before
+# serving; "snapshot" reads the ingredient list from a prebuilt vocabulary file (see
+# vocabulary.py) and leaves the graph sync to a background thread (APP_GRAPH_SYNC=background)
+# or to an explicit `python preprocessing.py` run (APP_GRAPH_SYNC=off).
+STARTUP_MODE = os.getenv("APP_STARTUP", "full")
+GRAPH_SYNC = os.getenv("APP_GRAPH_SYNC", "background")
 
-def get_all_ingredients():
-    with driver.session() as session:
-        result = session.run("MATCH (i:Ingredient) RETURN i.name AS name")
-        all_ingredients = [record["name"] for record in result]
-    return sorted(all_ingredients)
+# APP_NEAR_DUPLICATES=0 stores every generated recipe, even when a near-identical one exists
+NEAR_DUPLICATES = os.getenv("APP_NEAR_DUPLICATES", "1") == "1"
 
-df, tmp_ingredients = load_and_preprocess_data()
+# Function to load the CSV into the graph, making sure constraints and indexes exist first
+def sync_graph():
+    ensure_schema()
+    load_and_preprocess_data()
 
-# Get all ingredients from the knowledge graph
-all_ingredients = get_all_ingredients()
+# (title, ingredient names) of every stored recipe. RECOMMENDER_SOURCE=csv reads them
+# from the CSV's NER column instead of the graph.
+def recipe_sets():
+    if os.getenv("RECOMMENDER_SOURCE", "graph") == "csv":
+        return recipe_sets_from_csv(data_path)
+    return iter_recipe_ingredient_sets()
 
-# Function to prompt the AI model for structured JSON response
-def get_recipe_suggestion(ingredients):
+# Local recommender over stored recipes, kept current as recipes are written.
+# RECIPE_MATRIX_PATH memory-maps a prebuilt, read-only recipe_matrix snapshot.
+def build_recommender():
+    built = RecipeRecommender.from_records(recipe_sets())
+    add_write_listener(built.add_rows)
+    return built
+
+# Function to fill the near-duplicate index from the stored recipes (runs in the background;
+# lookups find nothing until it is done, apart from recipes written in the meantime)
+def _build_near_duplicate_index():
+    try:
+        started = time.perf_counter()
+        near_duplicate_index.add_many(recipe_sets(), bulk=True)
+        logger.info("Near-duplicate index built with %d recipes "
+                    "in %.1fs", len(near_duplicate_index), time.perf_counter() - started)
+    except Exception as e:
+        logger.error("Building the near-duplicate index failed: %s", e)
+
+def _background_startup():
+    global recommender
+    try:
+        if GRAPH_SYNC == "background":
+            started = time.perf_counter()
+            sync_graph()
+            logger.info("Background graph sync finished in %.1fs", time.perf_counter() - started)
+        if recommender is None:
+            recommender = build_recommender()
+    except Exception as e:
+        logger.error("Background startup task failed: %s", e)
+
+recommender = RecipeMatrix.load(os.getenv("RECIPE_MATRIX_PATH")) if os.getenv("RECIPE_MATRIX_PATH") else None
+# Constraints are created in every startup mode, even when the graph sync is off
+ensure_schema()
+if STARTUP_MODE == "snapshot":
+    ingredient_counts = load_vocabulary(VOCAB_PATH)
+    logger.info("Loaded %d ingredients from %s", len(ingredient_counts), VOCAB_PATH)
+    threading.Thread(target=_background_startup, name="startup-sync", daemon=True).start()
+else:
+    sync_graph()
+    # Get all ingredients and their recipe counts from the knowledge graph
+    ingredient_counts = vocabulary_from_graph()
+    if recommender is None:
+        recommender = build_recommender()
+
+# MinHash/LSH index over stored recipes, used to serve a stored recipe instead of
+# writing a generated near-duplicate of it (e.g. "Creamy Corn" vs "Creamy Corn Casserole")
+near_duplicate_index = NearDuplicateIndex()
+if NEAR_DUPLICATES:
+    add_write_listener(near_duplicate_index.add_rows)
+    threading.Thread(target=_build_near_duplicate_index, name="near-duplicates", daemon=True).start()
+
+# Co-occurrence counts behind the "Goes well with" suggestions. Loaded from the output of
+# `python ingredient_pairings.py` when present, otherwise counted from the stored recipes
+# in the background; recipes written while the app runs are counted as they are stored
+# and saved back every APP_PAIRINGS_SAVE_INTERVAL seconds and on exit.
+PAIRING_SUGGESTIONS = int(os.getenv("APP_PAIRING_SUGGESTIONS", "5"))
+PAIRINGS_SAVE_INTERVAL = float(os.getenv("APP_PAIRINGS_SAVE_INTERVAL", "300"))  # seconds
+
+# Rows written while the background count runs; they are replayed into the new index when it
+# replaces the placeholder, and their titles are skipped by the scan so none is counted twice
+_pairing_lock = threading.Lock()
+_pending_pairing_rows = None
+_pending_pairing_titles = set()
+
+def _build_pairing_index():
+    global pairing_index, _pending_pairing_rows
+    built = None
+    try:
+        built = PairingIndex.from_records((title, names) for title, names in recipe_sets()
+                                          if title not in _pending_pairing_titles)
+    except Exception as e:
+        logger.error("Counting ingredient pairings failed: %s", e)
+    with _pairing_lock:
+        if built is not None:
+            pairing_index = built
+        pairing_index.add_rows(_pending_pairing_rows)
+        _pending_pairing_rows = None
+        _pending_pairing_titles.clear()
+    if built is not None:
+        _start_saving_pairings()
+
+def _count_written_pairings(rows):
+    with _pairing_lock:
+        if _pending_pairing_rows is not None:
+            _pending_pairing_rows.extend(rows)
+            _pending_pairing_titles.update(row["title"] for row in rows)
+            return
+        index = pairing_index
+    index.add_rows(rows)
+
+# Function to write the pairing counts back to PAIRINGS_PATH when recipes were added
+def save_pairings():
+    try:
+        if pairing_index.unsaved:
+            pairing_index.save(PAIRINGS_PATH)
+    except Exception as e:
+        logger.error("Saving ingredient pairings failed: %s", e)
+
+def _save_pairings_periodically():
+    while True:
+        time.sleep(PAIRINGS_SAVE_INTERVAL)
+        save_pairings()
+
+# Only a loaded or fully counted index is saved; the empty placeholder never overwrites the counts
+def _start_saving_pairings():
+    if PAIRINGS_SAVE_INTERVAL > 0:
+        threading.Thread(target=_save_pairings_periodically, name="pairings-save", daemon=True).start()
+    atexit.register(save_pairings)
+
+if os.path.isdir(PAIRINGS_PATH):
+    pairing_index = PairingIndex.load(PAIRINGS_PATH)
+    logger.info("Loaded ingredient pairings from %s", PAIRINGS_PATH)
+    _start_saving_pairings()
+else:
+    pairing_index = PairingIndex()
+    if PAIRING_SUGGESTIONS:
+        _pending_pairing_rows = []
+        threading.Thread(target=_build_pairing_index, name="pairings", daemon=True).start()
+add_write_listener(_count_written_pairings)
+
+# Autocomplete index behind the ingredient search box; prefix search works right away,
+# substring and fuzzy matching once the trigram index has been built in the background
+search_index = IngredientSearchIndex.from_counts(ingredient_counts, trigrams=False)
+threading.Thread(target=search_index.build_trigrams, name="search-index", daemon=True).start()
+
+# All known ingredients; new ones are indexed for search at once and written to the graph in batches
+ingredient_registry = IngredientRegistry(ingredient_counts, writer=create_ingredient_nodes)
+ingredient_registry.add_listener(search_index.add)
+startup_seconds = time.perf_counter() - _import_started
+logger.info("App initialized in %.2fs (%s startup)", startup_seconds, STARTUP_MODE)
+
+_first_request_logged = False
+
+# Function to log time-to-first-request once per process
+def _report_first_request():
+    global _first_request_logged
+    if not _first_request_logged:
+        _first_request_logged = True
+        logger.info("First request %.2fs after startup began "
+                    "(initialization took %.2fs)", time.perf_counter() - _import_started, startup_seconds)
+
+RECOMMENDER_TOP_K = int(os.getenv("RECOMMENDER_TOP_K", "5"))
+
+# APP_STREAMING=1 renders the recipe while the model is still generating it
+STREAMING = os.getenv("APP_STREAMING", "0") == "1"
+
+# Maximum number of "Get recipes" requests Gradio runs at once; the rest wait in its queue
+APP_CONCURRENCY_LIMIT = int(os.getenv("APP_CONCURRENCY_LIMIT", "16"))
+
+# Concurrent requests for the same ingredient set share one LLM call, and concurrent
+# writes of the same title share one graph write
+suggestion_flight = SingleFlight("recipe suggestion")
+recipe_write_flight = SingleFlight("recipe write")
+
+def coalescing_stats():
+    # Call / execution / coalesced counters of the request coalescing
+    return {"suggestion": suggestion_flight.stats(), "write": recipe_write_flight.stats()}
+
+# Function to build the chat messages and JSON response format of a recipe request
+def build_recipe_request(ingredients):
     ingredient_text = ', '.join(ingredients) 
 
-    logger.debug(f"Prompting model with ingredients: {ingredients}")
+    logger.debug("Prompting model with ingredients: %s", ingredients)
     messages = [
         {"role": "system", "content": "You are a culinary expert. Provide the full recipe details including title, ingredients, directions, and tips in JSON format."},
         {"role": "user", "content": f"Provide the recipe details in the specified JSON format using only these ingredients: {ingredient_text}."}
@@ -82,37 +262,92 @@ def get_recipe_suggestion(ingredients):
             "schema": schema
         }
     }
+    return messages, response_format
 
-    response = call_kolank_api(messages, response_format)
+# Function to prompt the AI model for structured JSON response
+def get_recipe_suggestion(ingredients):
+    messages, response_format = build_recipe_request(ingredients)
+    with timed("suggestion"):
+        response = call_kolank_api(messages, response_format, cache_ingredients=ingredients)
     if response:
         return response  # Parse JSON response
     else:
         return "Error generating recipe. Please try again."
 
-# Function to check if a recipe exists in the KG
-def check_recipe_in_kg(title, ingredients):
-    with driver.session() as session:
-        result = session.run(
-            "MATCH (r:Product {title: $title})-[:USES]->(i:Ingredient) "
-            "WHERE i.name IN $ingredients "
-            "RETURN r.title, collect(i.name) as ingredients",
-            title=title,
-            ingredients=ingredients
-        )
-        return result.single() is not None
+# Function to format a recipe dict as Markdown
+def format_recipe_markdown(recipe, heading):
+    with timed("render"):
+        # A partially streamed recipe has None for a key whose value has not started yet
+        ingredients = recipe.get('Ingredients') or []
+        directions = recipe.get('directions') or []
+        tips = recipe.get('tips') or ""
+
+        result = f"**{heading}**\n\n"
+        result += f"**Title:** {recipe.get('title') or 'Untitled Recipe'}\n\n"
+        result += "**Ingredients:**\n" + "\n".join(
+            f"- {ingredient.get('quantity') or 'to taste'} {ingredient.get('ingredient') or ''}".strip()
+            for ingredient in ingredients
+        ) + "\n\n"
+        result += "**Directions:**\n" + "\n".join(f"**Step {i+1}:** {step}" for i, step in enumerate(directions)) + "\n\n"
+        if tips:
+            result += f"**Tips:** {tips}\n"  # Join the tips into a single string
+        return result
+
+# Function to serve a stored recipe that the selection covers well enough
+def recommend_from_graph(ingredients):
+    if recommender is None:
+        # Still being built in the background
+        return None
+    with timed("recommend"):
+        matches = recommender.recommend(ingredients, k=RECOMMENDER_TOP_K, min_coverage=MIN_COVERAGE)
+    for title, coverage, matched in matches:
+        with timed("graph_check"):
+            recipe = get_product_from_kg(title)
+        if recipe is None:
+            continue
+        logger.info("Serving stored recipe '%s' (%.0f%% of its ingredients selected)", title, 100 * coverage)
+        result = format_recipe_markdown(recipe, "Recipe from the Knowledge Graph:")
+        others = [other for other, _, _ in matches if other != title]
+        if others:
+            result += "\n**Also matching:** " + ", ".join(others) + "\n"
+        return result
+    return None
+
+# Function to look up a stored recipe that a generated one nearly duplicates
+def find_near_duplicate(title, ingredients):
+    if not NEAR_DUPLICATES:
+        return None
+    with timed("near_duplicate"):
+        names = [ingredient.get('ingredient', '') if isinstance(ingredient, dict) else ingredient
+                 for ingredient in ingredients]
+        match = near_duplicate_index.find(title, names)
+    if match is None:
+        return None
+    similar_title, similarity = match
+    with timed("graph_check"):
+        stored = get_product_from_kg(similar_title)
+    if stored is not None:
+        logger.info("Recipe '%s' is a near-duplicate of '%s' "
+                    "(similarity %.2f); serving the stored recipe", title, similar_title, similarity)
+    return stored
 
 # Function to process the recipe data and create nodes/edges in the graph
 def process_recipe_data(recipe_data):
-    logger.debug(f"Processing recipe data: {recipe_data}")
+    logger.debug("Processing recipe data: %s", recipe_data)
     
     if isinstance(recipe_data, dict):
         title = recipe_data.get('title', 'Untitled Recipe')
         ingredients = recipe_data.get('Ingredients', [])
-        ingredient_names = [ing.get('ingredient', '') for ing in ingredients]
         
-        if check_recipe_in_kg(title, ingredient_names):
-            logger.info(f"Recipe '{title}' already exists in the KG.")
-            return get_recipe_from_kg(title, ingredient_names)
+        # One cached lookup both checks for and fetches a stored recipe with this title
+        with timed("graph_check"):
+            stored = get_product_from_kg(title)
+        if stored is not None:
+            logger.info("Recipe '%s' already exists in the KG.", title)
+            return format_recipe_markdown(stored, "Recipe from the Knowledge Graph:")
+        similar = find_near_duplicate(title, ingredients)
+        if similar is not None:
+            return format_recipe_markdown(similar, "Similar Recipe from the Knowledge Graph:")
         else:
             directions = recipe_data.get('directions', [])
             tips = recipe_data.get('tips', "")
@@ -121,110 +356,216 @@ def process_recipe_data(recipe_data):
             create_knowledge_graph(title, ingredients, directions)
             
             # Format the output for display
-            result = f"**New Recipe Generated:**\n\n"
-            result += f"**Title:** {title}\n\n"
-            result += "**Ingredients:**\n" + "\n".join(
-                f"- {ingredient.get('quantity', 'to taste')} {ingredient.get('ingredient', '')}".strip()
-                for ingredient in ingredients
-            ) + "\n\n"
-            result += "**Directions:**\n" + "\n".join(f"**Step {i+1}:** {step}" for i, step in enumerate(directions)) + "\n\n"
-            if tips:
-                result += f"**Tips:** {tips}\n"  # Join the tips into a single string
-            
-            return result
+            return format_recipe_markdown(
+                {'title': title, 'Ingredients': ingredients, 'directions': directions, 'tips': tips},
+                "New Recipe Generated:")
     else:
         logger.error("Recipe data does not have the expected structure.")
         return "Error generating recipe. Please try again."
 
-# # Function to get recipes based on selected ingredients
-# def get_recipes(selected_ingredients, new_ingredient):
-#     logger.debug(f"Selected ingredients: {selected_ingredients}, New ingredient: {new_ingredient}")
-#     global all_ingredients  # Declare the variable as global
-#     if new_ingredient and new_ingredient not in all_ingredients:
-#         try:
-#             all_ingredients = add_new_ingredient(new_ingredient, all_ingredients)
-#             logger.debug(f"Ingredient list after adding: {all_ingredients}")
-#         except Exception as e:
-#             logger.error(f"Error adding new ingredient: {e}")
-#             return "Error adding new ingredient. Please try again."
-
-#     logger.debug(f"Final set of ingredients: {set(selected_ingredients)}")
-#     recipe_data = get_recipe_suggestion(list(set(selected_ingredients)))
-    
-#     return process_recipe_data(recipe_data)
-def get_recipes(selected_ingredients, new_ingredient):
-    logger.debug(f"Selected ingredients: {selected_ingredients}, New ingredient: {new_ingredient}")
+# Function to combine the checked ingredients with one typed into the search box
+def selected_ingredient_set(selected_ingredients, new_ingredient):
     ingredients_to_use = set(selected_ingredients or [])
-    
     if new_ingredient:
         new_ingredient = new_ingredient.strip()
-        if new_ingredient and new_ingredient not in ingredients_to_use:
+        if new_ingredient:
             ingredients_to_use.add(new_ingredient)
+        if new_ingredient and new_ingredient not in ingredient_registry:
             try:
-                all_ingredients = add_new_ingredient(new_ingredient, all_ingredients)
+                add_new_ingredient(new_ingredient, ingredient_registry)
             except Exception as e:
-                logger.error(f"Error adding new ingredient: {e}")
+                logger.error("Error adding new ingredient: %s", e)
+    return ingredients_to_use
+
+def get_recipes(selected_ingredients, new_ingredient):
+    _report_first_request()
+    start_trace()
+    logger.debug("Selected ingredients: %s, New ingredient: %s", selected_ingredients, new_ingredient)
+    ingredients_to_use = selected_ingredient_set(selected_ingredients, new_ingredient)
     
     if not ingredients_to_use:
         return "Please select at least one ingredient"
         
+    with timed("request"):
+        return _generate_recipe(ingredients_to_use)
+
+def _generate_recipe(ingredients_to_use):
     try:
-        recipe_data = get_recipe_suggestion(list(ingredients_to_use))
+        # Only ask the LLM when no stored recipe is covered by the selection
+        stored = recommend_from_graph(ingredients_to_use)
+        if stored:
+            return stored
+        ingredient_key = tuple(normalize_ingredients(ingredients_to_use))
+        recipe_data = suggestion_flight.do(ingredient_key, get_recipe_suggestion, list(ingredients_to_use))
+        if isinstance(recipe_data, dict):
+            return recipe_write_flight.do(recipe_data.get('title', 'Untitled Recipe'),
+                                          process_recipe_data, recipe_data)
         return process_recipe_data(recipe_data)
     except Exception as e:
-        logger.error(f"Error generating recipe: {e}")
+        logger.error("Error generating recipe: %s", e)
         return "Error generating recipe. Please try again."
+
+# Generator version of get_recipes: yields Markdown that grows as the model streams
+# the recipe (title, then ingredients, then each step), and saves it once complete
+def get_recipes_stream(selected_ingredients, new_ingredient):
+    _report_first_request()
+    start_trace()
+    logger.debug("Selected ingredients: %s, New ingredient: %s", selected_ingredients, new_ingredient)
+    ingredients_to_use = selected_ingredient_set(selected_ingredients, new_ingredient)
+
+    if not ingredients_to_use:
+        yield "Please select at least one ingredient"
+        return
+
+    try:
+        stored = recommend_from_graph(ingredients_to_use)
+        if stored:
+            yield stored
+            return
+        ingredients = list(ingredients_to_use)
+        messages, response_format = build_recipe_request(ingredients)
+        parser = PartialJSONParser()
+        shown = None
+        started = time.perf_counter()
+        # Concurrent requests for the same ingredient set read one shared model stream
+        ingredient_key = tuple(normalize_ingredients(ingredients))
+        pieces = suggestion_flight.stream(ingredient_key, stream_kolank_api, messages, response_format,
+                                          cache_ingredients=ingredients)
+        for piece in pieces:
+            parser.feed(piece)
+            partial = parser.value()
+            if isinstance(partial, dict) and partial and partial != shown:
+                if shown is None:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, "first_content")
+                shown = partial
+                yield format_recipe_markdown(partial, "Generating Recipe...")
+
+        recipe_data = parser.value() if parser.complete else None
+        if not isinstance(recipe_data, dict):
+            logger.error("Recipe stream ended without a complete JSON response")
+            yield "Error generating recipe. Please try again."
+            return
+        yield recipe_write_flight.do(recipe_data.get('title', 'Untitled Recipe'),
+                                     process_recipe_data, recipe_data)
+    except Exception as e:
+        logger.error("Error generating recipe: %s", e)
+        yield "Error generating recipe. Please try again."
+
+# Pipeline counters exported next to the stage timings (METRICS_PORT enables the endpoint)
+gauge("recipe_coalescing", "Request coalescing counters",
+      lambda: {f"{flight}_{name}": value for flight, stats in coalescing_stats().items()
+               for name, value in stats.items()}, "counter")
+gauge("neo4j_pool", "Neo4j connection pool and session counters", graph_db.pool_metrics, "metric")
+gauge("recipe_cache", "Stored recipe read-through cache counters", knowledge_graph.recipe_cache.stats, "metric")
+gauge("near_duplicate_index", "Near-duplicate index size", near_duplicate_index.stats, "metric")
+gauge("ingredient_pairings", "Ingredient co-occurrence index size", lambda: pairing_index.stats(), "metric")
+if model_call.LLM_CACHE:
+    gauge("llm_response_cache", "LLM response cache counters",
+          lambda: model_call.get_response_cache().stats(), "metric")
+start_metrics_server()
+
+# Function to build the checkbox choices for one page of search results; selected
+# ingredients stay in the choices so they are not dropped from the selection
+def ingredient_page(query, selected, page=0):
+    matches, total = search_index.search(query or "", page=page, page_size=SEARCH_PAGE_SIZE)
+    choices = selected + [name for name in matches if name not in selected]
+    first = page * SEARCH_PAGE_SIZE + 1 if matches else 0
+    info = f"{total} matching ingredients (showing {first}-{first + len(matches) - 1 if matches else 0})"
+    return choices, info
+
+# Function to suggest ingredients that pair well with the current selection
+def suggest_pairings(selected):
+    if not selected or not PAIRING_SUGGESTIONS:
+        return ""
+    with timed("pairings"):
+        suggestions = pairing_index.suggest(selected, k=PAIRING_SUGGESTIONS)
+    return f"**Goes well with:** {', '.join(suggestions)}" if suggestions else ""
+
 # Gradio Interface
 with gr.Blocks() as demo:
     gr.Markdown("# Recipe Recommendation System")
     
     search_input = gr.Textbox(
         label="Search or Add Ingredient",
-        placeholder="Type an ingredient and press Enter to add if not found"
+        placeholder="Type to search, press Enter to add an ingredient that is not listed"
     )
     
+    initial_choices, initial_info = ingredient_page("", [])
     ingredients_input = gr.CheckboxGroup(
-        choices=all_ingredients,
+        choices=initial_choices,
         label="Select Available Ingredients",
         interactive=True,
         elem_id="ingredients-selection"
     )
+    with gr.Row():
+        results_info = gr.Markdown(initial_info)
+        more_button = gr.Button("More results", size="sm")
+    page_state = gr.State(0)
+    pairings_output = gr.Markdown()
     
     generate_button = gr.Button("Get recipes")
     output = gr.Markdown(label="Recommended Recipes")
     
-    def update_ingredient_list(search_input_value):
-        logger.debug(f"Search input received: {search_input_value}")
-        global all_ingredients
+    def search_ingredients(query, selected):
+        _report_first_request()
+        selected = list(selected or [])
+        choices, info = ingredient_page(query, selected)
+        return gr.update(choices=choices, value=selected), info, 0
+
+    def next_page(query, selected, page):
+        # Wrap around to the first page after the last one
+        _, total = search_index.search(query or "", page_size=1)
+        page = page + 1 if (page + 1) * SEARCH_PAGE_SIZE < total else 0
+        selected = list(selected or [])
+        choices, info = ingredient_page(query, selected, page)
+        return gr.update(choices=choices, value=selected), info, page
+
+    def update_ingredient_list(search_input_value, selected):
+        _report_first_request()
+        logger.debug("Search input received: %s", search_input_value)
         
-        if not search_input_value:
-            return gr.update(choices=all_ingredients)
-            
         # Clean the input
-        search_input_value = search_input_value.strip()
-        print("values::::::::",search_input_value,all_ingredients)
-        if search_input_value and search_input_value not in all_ingredients:
+        search_input_value = (search_input_value or "").strip()
+        selected = list(selected or [])
+        if search_input_value and search_input_value not in ingredient_registry:
             try:
                 # Add new ingredient
-                all_ingredients = add_new_ingredient(search_input_value, all_ingredients)
-                logger.debug(f"Updated ingredient list: {all_ingredients}")
-                return gr.update(choices=all_ingredients, value=[search_input_value])
+                add_new_ingredient(search_input_value, ingredient_registry)
+                selected.append(search_input_value)
             except Exception as e:
-                logger.error(f"Error updating ingredient list: {e}")
-                return gr.update(choices=all_ingredients)
-                
-        return gr.update(choices=all_ingredients)
+                logger.error("Error updating ingredient list: %s", e)
+        choices, info = ingredient_page(search_input_value, selected)
+        return gr.update(choices=choices, value=selected), info, 0
+
+    search_input.change(
+        search_ingredients,
+        inputs=[search_input, ingredients_input],
+        outputs=[ingredients_input, results_info, page_state]
+    )
 
     search_input.submit(
         update_ingredient_list, 
-        inputs=search_input, 
-        outputs=ingredients_input
+        inputs=[search_input, ingredients_input], 
+        outputs=[ingredients_input, results_info, page_state]
+    )
+
+    ingredients_input.change(
+        suggest_pairings,
+        inputs=ingredients_input,
+        outputs=pairings_output
+    )
+
+    more_button.click(
+        next_page,
+        inputs=[search_input, ingredients_input, page_state],
+        outputs=[ingredients_input, results_info, page_state]
     )
     
     generate_button.click(
-        get_recipes, 
+        get_recipes_stream if STREAMING else get_recipes, 
         inputs=[ingredients_input, search_input], 
-        outputs=output
+        outputs=output,
+        concurrency_limit=APP_CONCURRENCY_LIMIT
     )
 
 # Launch Gradio app
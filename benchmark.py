@@ -0,0 +1,397 @@
+# benchmark.py
+
+import argparse
+import atexit
+import csv
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stub_llm_server import start_stub_server
+
+logger = logging.getLogger(__name__)
+
+# Default workload; every setting can be overridden on the command line
+BENCH_RECIPES = 20000
+BENCH_VOCABULARY = 5000
+BENCH_ZIPF_S = 1.1          # ingredient popularity follows 1/rank**s
+BENCH_REQUESTS = 200
+BENCH_CONCURRENCY = 8
+BENCH_LLM_LATENCY = 0.2     # seconds per stub completion
+
+_UNITS = ["cup", "c.", "tsp.", "Tbsp.", "oz.", "lb.", "can", "pkg.", "clove", ""]
+_SYLLABLES = ["ba", "ko", "lu", "mi", "ra", "te", "sho", "pa", "ne", "vi", "ga", "do", "zu", "fe", "ri", "ta"]
+
+def synthetic_vocabulary(size, seed=0):
+    """
+    Distinct, pronounceable ingredient names, most popular first.
+    Args:
+        size (int): Number of names
+        seed (int): Random seed
+    Returns:
+        list: Ingredient names
+    """
+    rng = np.random.default_rng(seed)
+    names, seen = [], set()
+    while len(names) < size:
+        words = ["".join(rng.choice(_SYLLABLES, rng.integers(2, 4))) for _ in range(rng.integers(1, 3))]
+        name = " ".join(words)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+def zipf_probabilities(size, s=BENCH_ZIPF_S):
+    popularity = 1.0 / np.arange(1, size + 1) ** s
+    return popularity / popularity.sum()
+
+def generate_recipe_csv(path, recipes=BENCH_RECIPES, vocabulary_size=BENCH_VOCABULARY, zipf_s=BENCH_ZIPF_S,
+                        seed=0):
+    """
+    Write a RecipeNLG-shaped CSV (index, title, ingredients, directions, link,
+    source, NER) whose ingredients are drawn from a Zipf distribution.
+    Args:
+        path (str): Output CSV path
+        recipes (int): Number of recipes
+        vocabulary_size (int): Number of distinct ingredients
+        zipf_s (float): Zipf exponent of ingredient popularity
+        seed (int): Random seed; the same arguments always produce the same file
+    Returns:
+        list: The ingredient vocabulary, most popular first
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = synthetic_vocabulary(vocabulary_size, seed)
+    probabilities = zipf_probabilities(vocabulary_size, zipf_s)
+    sizes = rng.integers(3, 13, recipes)
+    draws = rng.choice(vocabulary_size, int(sizes.sum()), p=probabilities)
+    offset = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["", "title", "ingredients", "directions", "link", "source", "NER"])
+        for index, size in enumerate(sizes):
+            names = list(dict.fromkeys(vocabulary[i] for i in draws[offset:offset + size]))
+            offset += size
+            lines = [f"{rng.integers(1, 5)} {rng.choice(_UNITS)} {name}".replace("  ", " ") for name in names]
+            directions = [f"Add the {name}." for name in names] + ["Cook until done."]
+            title = f"{names[0].title()} with {names[-1].title()} {index}"
+            writer.writerow([index, title, json.dumps(lines), json.dumps(directions),
+                             f"example.com/recipes/{index}", "Synthetic", json.dumps(names)])
+    return vocabulary
+
+def _percentiles(seconds):
+    milliseconds = np.asarray(seconds) * 1000
+    p50, p90, p95, p99 = np.percentile(milliseconds, [50, 90, 95, 99])
+    return {"p50_ms": float(p50), "p90_ms": float(p90), "p95_ms": float(p95), "p99_ms": float(p99),
+            "max_ms": float(milliseconds.max()), "mean_ms": float(milliseconds.mean())}
+
+def _traced(fn, *args, **kwargs):
+    # Run fn under tracemalloc; returns (result, peak traced bytes)
+    tracemalloc.start()
+    try:
+        result = fn(*args, **kwargs)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark_ingest(csv_path, work_dir, batch_size=None, trace_memory=True):
+    """
+    Time load_and_preprocess_data into a fresh in-memory graph, then repeat
+    the load under tracemalloc for its memory peak (tracing slows it down,
+    so the two are measured separately).
+    Returns:
+        dict: rows, seconds, rows_per_sec and peak_mb
+    """
+    from graph_backend import InMemoryGraphBackend, set_backend
+    from knowledge_graph import BULK_BATCH_SIZE
+    from preprocessing import iter_csv_chunks, load_and_preprocess_data
+
+    batch_size = batch_size or BULK_BATCH_SIZE
+    rows = sum(len(chunk) for chunk in iter_csv_chunks(csv_path))
+
+    def load(run):
+        backend = InMemoryGraphBackend()
+        set_backend(backend)
+        load_and_preprocess_data(csv_path, batch_size=batch_size,
+                                 manifest_path=os.path.join(work_dir, f"ingest_{run}.sqlite"))
+        return len(backend)
+
+    started = time.perf_counter()
+    stored = load("timed")
+    seconds = time.perf_counter() - started
+    result = {"rows": rows, "recipes_stored": stored, "seconds": seconds, "rows_per_sec": rows / seconds}
+    if trace_memory:
+        _, peak = _traced(load, "traced")
+        result["peak_mb"] = peak / 2 ** 20
+    logger.info("Ingest: %d rows in %.2fs (%.0f rows/s)", rows, seconds, result["rows_per_sec"])
+    return result
+
+def benchmark_requests(vocabulary, stub, requests=BENCH_REQUESTS, concurrency=BENCH_CONCURRENCY,
+                       zipf_s=BENCH_ZIPF_S, seed=0, trace_memory=True):
+    """
+    Import the app against the in-memory graph and the stub LLM, then call
+    get_recipes from concurrent threads with Zipf-sampled ingredient sets.
+    Returns:
+        dict: startup and request results
+    """
+    from graph_backend import InMemoryGraphBackend, set_backend
+
+    set_backend(InMemoryGraphBackend())
+    started = time.perf_counter()
+    if trace_memory:
+        app, startup_peak = _traced(__import__, "app")
+    else:
+        import app
+        startup_peak = None
+    startup = {"seconds": time.perf_counter() - started}
+    if startup_peak is not None:
+        startup["peak_mb"] = startup_peak / 2 ** 20
+
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(len(vocabulary), zipf_s)
+    selections = [sorted({vocabulary[i] for i in rng.choice(len(vocabulary), rng.integers(2, 6), p=probabilities)})
+                  for _ in range(requests)]
+
+    def call(selection):
+        started = time.perf_counter()
+        markdown = app.get_recipes(selection, "")
+        return time.perf_counter() - started, markdown.startswith("Error")
+
+    llm_requests_before = stub.requests
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(call, selections))
+    wall_seconds = time.perf_counter() - started
+
+    latencies = [seconds for seconds, _ in outcomes]
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(failed for _, failed in outcomes),
+        "llm_requests": stub.requests - llm_requests_before,
+        "wall_seconds": wall_seconds,
+        "requests_per_sec": requests / wall_seconds,
+        **_percentiles(latencies),
+    }
+    result["coalescing"] = app.coalescing_stats()
+    # The app saves its pairing counts on exit, after work_dir has been removed
+    atexit.unregister(app.save_pairings)
+    logger.info("get_recipes: %d requests x%d in %.2fs, p50 %.1f ms, p99 %.1f ms, "
+                "%d LLM calls, %d errors", requests, concurrency, wall_seconds,
+                result["p50_ms"], result["p99_ms"], result["llm_requests"], result["errors"])
+    return {"startup": startup, "requests": result}
+
+# Per-statement write path create_knowledge_graph used before it sent a recipe in one
+# transaction: every node and edge is its own MERGE/CREATE and its own commit
+_LEGACY_WRITES = {
+    "product": "MERGE (p:Product {title: $title}) SET p.directions = $directions",
+    "ingredient": "MERGE (i:Ingredient {name: $name})",
+    "used_in": "MATCH (i:Ingredient {name: $name}) MATCH (p:Product {title: $title}) "
+               "MERGE (i)-[r:USED_IN {quantity: $quantity}]->(p)",
+    "direction": "MATCH (p:Product {title: $title}) "
+                 "CREATE (d:Direction {order: $order, description: $description}) "
+                 "CREATE (p)-[:HAS_STEP {order: $order}]->(d)",
+}
+
+def _write_recipe_per_statement(recipe):
+    import graph_db
+
+    def run(query, **params):
+        graph_db.execute_write(lambda tx: tx.run(query, params).consume(), neo4j_session=neo4j_session)
+
+    with graph_db.session() as neo4j_session:
+        run(_LEGACY_WRITES["product"], title=recipe["title"], directions=recipe["directions"])
+        for ingredient in recipe["ingredients"]:
+            run(_LEGACY_WRITES["ingredient"], name=ingredient["ingredient"])
+            run(_LEGACY_WRITES["used_in"], name=ingredient["ingredient"], title=recipe["title"],
+                quantity=ingredient["quantity"])
+        for order, step in enumerate(recipe["directions"], start=1):
+            run(_LEGACY_WRITES["direction"], title=recipe["title"], order=order, description=step)
+
+def benchmark_graph_writes(csv_path, recipes=100):
+    """
+    Per-recipe write latency against the Neo4j server in NEO4J_URI: the old
+    per-statement path (one commit per node and edge) versus
+    create_knowledge_graph (one transaction per recipe). Each path writes
+    its own copies of the first `recipes` CSV rows under a benchmark-only
+    title and ingredient prefix, and both copies are deleted afterwards.
+    Returns:
+        dict: Latency percentiles of each path and the p50 speedup
+    """
+    import graph_db
+    from graph_backend import Neo4jGraphBackend, set_backend
+    from knowledge_graph import create_knowledge_graph
+
+    prefix = f"bench-write-{os.getpid()}-"
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = [row for _, row in zip(range(recipes), csv.DictReader(f))]
+
+    def recipe(row, path):
+        return {"title": f"{prefix}{path}-{row['title']}",
+                "ingredients": [{"quantity": "1", "ingredient": f"{prefix}{name}"} for name in json.loads(row["NER"])],
+                "directions": json.loads(row["directions"])}
+
+    set_backend(Neo4jGraphBackend())
+    result = {}
+    try:
+        for path, write in (("per_statement", _write_recipe_per_statement),
+                            ("single_transaction", lambda r: create_knowledge_graph(r["title"], r["ingredients"],
+                                                                                    r["directions"]))):
+            seconds = []
+            for row in rows:
+                started = time.perf_counter()
+                write(recipe(row, path))
+                seconds.append(time.perf_counter() - started)
+            result[path] = _percentiles(seconds)
+    finally:
+        graph_db.run_write("MATCH (p:Product) WHERE p.title STARTS WITH $prefix "
+                           "OPTIONAL MATCH (p)-[:HAS_STEP]->(d:Direction) DETACH DELETE p, d", prefix=prefix)
+        graph_db.run_write("MATCH (i:Ingredient) WHERE i.name STARTS WITH $prefix DETACH DELETE i", prefix=prefix)
+    result["recipes"] = len(rows)
+    result["p50_speedup"] = result["per_statement"]["p50_ms"] / result["single_transaction"]["p50_ms"]
+    logger.info("Graph writes: per-statement p50 %.1f ms, single transaction p50 %.1f ms per recipe",
+                result["per_statement"]["p50_ms"], result["single_transaction"]["p50_ms"])
+    return result
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = [
+    (("ingest", "rows_per_sec"), True),
+    (("ingest", "peak_mb"), False),
+    (("startup", "seconds"), False),
+    (("startup", "peak_mb"), False),
+    (("requests", "requests_per_sec"), True),
+    (("requests", "p50_ms"), False),
+    (("requests", "p99_ms"), False),
+    ("max_rss_mb", False),
+]
+
+def compare_results(results, baseline, tolerance=0.1):
+    """
+    Log each compared metric's change against a previous run.
+    Args:
+        results (dict): This run
+        baseline (dict): A previous run's results
+        tolerance (float): Relative change in the wrong direction reported as a regression
+    Returns:
+        list: Names of the regressed metrics
+    """
+    def lookup(data, key):
+        for part in (key if isinstance(key, tuple) else (key,)):
+            data = data.get(part) if isinstance(data, dict) else None
+        return data
+
+    regressions = []
+    for key, higher_is_better in COMPARED_METRICS:
+        current, previous = lookup(results, key), lookup(baseline, key)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        name = ".".join(key) if isinstance(key, tuple) else key
+        regressed = (-change if higher_is_better else change) > tolerance
+        if regressed:
+            regressions.append(name)
+        logger.log(logging.WARNING if regressed else logging.INFO,
+                   "%s: %.2f -> %.2f (%+.1f%%)%s", name, previous, current, change * 100,
+                   " REGRESSION" if regressed else "")
+    return regressions
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="recipe-bench-")
+    stub = None
+    try:
+        csv_path = args.csv or os.path.join(work_dir, "recipes.csv")
+        if args.csv:
+            with open(args.csv, newline="", encoding="utf-8") as f:
+                vocabulary = sorted({name for row in csv.DictReader(f) for name in json.loads(row["NER"])})
+        else:
+            vocabulary = generate_recipe_csv(csv_path, args.recipes, args.vocabulary, args.zipf, args.seed)
+            logger.info("Generated %d synthetic recipes over %d ingredients", args.recipes, len(vocabulary))
+
+        stub = start_stub_server(latency=args.llm_latency, echo=True)
+        # Settings read at import time by the project modules
+        os.environ.update({
+            "KOLANK_URL": stub.base_url,
+            "KOLANK_API_KEY": "benchmark",
+            "GRAPH_BACKEND": "memory",
+            "RECIPE_CSV_PATH": csv_path,
+            "INGEST_MANIFEST_PATH": os.path.join(work_dir, "app_manifest.sqlite"),
+            "LLM_CACHE_PATH": os.path.join(work_dir, "llm_cache.sqlite"),
+            "INGREDIENT_PAIRINGS_PATH": os.path.join(work_dir, "ingredient_pairings"),
+            "APP_STARTUP": "full",
+        })
+        os.environ.pop("MEMORY_GRAPH_PATH", None)
+        if not args.llm_cache:
+            os.environ["LLM_CACHE"] = "0"
+
+        trace_memory = not args.no_memory
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("out", "baseline")},
+            "ingest": benchmark_ingest(csv_path, work_dir, args.batch_size, trace_memory),
+        }
+        if args.graph_writes:
+            results["graph_writes"] = benchmark_graph_writes(csv_path, args.graph_writes)
+        if not args.skip_requests:
+            results.update(benchmark_requests(vocabulary, stub, args.requests, args.concurrency, args.zipf,
+                                              args.seed, trace_memory))
+        # ru_maxrss is in kilobytes on Linux
+        results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return results
+    finally:
+        if stub is not None:
+            stub.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest and get_recipes against local stand-ins "
+                                                 "for the LLM (stub server) and the graph (in-memory backend)")
+    parser.add_argument("--csv", help="Benchmark this RecipeNLG CSV instead of a synthetic one")
+    parser.add_argument("--recipes", type=int, default=BENCH_RECIPES, help="Synthetic recipes to generate")
+    parser.add_argument("--vocabulary", type=int, default=BENCH_VOCABULARY, help="Distinct synthetic ingredients")
+    parser.add_argument("--zipf", type=float, default=BENCH_ZIPF_S, help="Zipf exponent of ingredient popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, help="Ingest batch size (default NEO4J_BATCH_SIZE)")
+    parser.add_argument("--requests", type=int, default=BENCH_REQUESTS, help="get_recipes calls")
+    parser.add_argument("--concurrency", type=int, default=BENCH_CONCURRENCY, help="Concurrent callers")
+    parser.add_argument("--llm-latency", type=float, default=BENCH_LLM_LATENCY, help="Stub seconds per completion")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--skip-requests", action="store_true", help="Only benchmark ingest")
+    parser.add_argument("--graph-writes", type=int, default=0, metavar="RECIPES",
+                        help="Also compare per-recipe write latency of the old per-statement path and "
+                             "the single-transaction path on the Neo4j server in NEO4J_URI")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs")
+    parser.add_argument("--out", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown reported as a regression when comparing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    results = run(args)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    logger.info("Wrote results to %s", args.out)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(f"Regressed: {', '.join(regressions)}")
@@ -3,8 +3,8 @@
 import pandas as pd
 import json
 import logging
-from model_call import call_kolank_api, call_openai_api
-logging.basicConfig(level=logging.DEBUG)
+from model_call import call_kolank_api_batch, call_openai_api
+import ingredient_parser
 logger = logging.getLogger(__name__)
 
 
@@ -16,76 +16,89 @@ def load_data(file_path):
     if 'ingredients' not in df.columns:
         raise KeyError("The CSV file does not contain an 'ingredients' column.")
 
-    # Define a function to call the model for parsing the full recipe details
-    def get_full_recipe_details(recipe_title, ingredient_list):
+    # Define the JSON schema with the corrected format
+    schema = {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "Ingredients": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "quantity": {"type": "string"},
+                        "ingredient": {"type": "string"}
+                    },
+                    "required": ["quantity", "ingredient"],
+                    "additionalProperties": False
+                }
+            },
+            "directions": {
+                "type": "array",
+                "items": {"type": "string"}
+            },
+            "tips": {"type": "string"}
+        },
+        "required": ["title", "Ingredients", "directions", "tips"],
+        "additionalProperties": False
+    }
+
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "recipe_response",
+            "strict": True,
+            "schema": schema
+        }
+    }
+
+    # Define a function to build the model messages for the full recipe details
+    def get_full_recipe_messages(recipe_title, ingredient_list):
         # Convert the list to a single string if it's not already
         ingredient_text = ', '.join(ingredient_list) if isinstance(ingredient_list, list) else ingredient_list
 
-        # Define the messages to send to the model
-        messages = [
+        return [
             {"role": "system", "content": "You are a culinary expert. Provide the full recipe details including title, ingredients, directions, and tips in JSON format."},
             {"role": "user", "content": f"Title: {recipe_title}. Ingredients: {ingredient_text}. Provide the recipe details in the specified JSON format."}
         ]
 
-        # Define the JSON schema with the corrected format
-        schema = {
-            "type": "object",
-            "properties": {
-                "title": {"type": "string"},
-                "Ingredients": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "quantity": {"type": "string"},
-                            "ingredient": {"type": "string"}
-                        },
-                        "required": ["quantity", "ingredient"],
-                        "additionalProperties": False
-                    }
-                },
-                "directions": {
-                    "type": "array",
-                    "items": {"type": "string"}
-                },
-                "tips": {"type": "string"}
-            },
-            "required": ["title", "Ingredients", "directions", "tips"],
-            "additionalProperties": False
-        }
-
-        response_format = {
-            "type": "json_schema",
-            "json_schema": {
-                "name": "recipe_response",
-                "strict": True,
-                "schema": schema
-            }
-        }
-
-        return call_kolank_api(messages, response_format=response_format)
-
-    # Apply the function to each row's 'ingredients' column and store the results in 'parsed_ingredients'
-    df['parsed_ingredients'] = df.apply(lambda row: get_full_recipe_details(row['title'], row['ingredients'])['Ingredients'], axis=1)
+    # Send all rows to the model concurrently and store the results in 'parsed_ingredients'
+    messages_list = [get_full_recipe_messages(title, ingredients)
+                     for title, ingredients in zip(df['title'], df['ingredients'])]
+    responses = call_kolank_api_batch(messages_list, response_format)
+    df['parsed_ingredients'] = [response['Ingredients'] if response else [] for response in responses]
 
     return df
 
-def parse_ingredients_list(ingredients_str):
+def parse_json_list(value):
+    """
+    Parse a JSON-array cell such as the 'ingredients', 'directions' or 'NER'
+    columns of the recipe CSV.
+    Args:
+        value (str): Cell content, e.g. '["1 c. sugar", "2 eggs"]'
+    Returns:
+        list: The parsed list of strings, or an empty list if the cell is empty
+    Raises:
+        ValueError: If the cell is not a JSON array
+    """
+    if not isinstance(value, str) or not value:
+        return []
+    parsed = json.loads(value)
+    if not isinstance(parsed, list):
+        raise ValueError(f"Expected a JSON array, got {type(parsed).__name__}")
+    return [str(item) for item in parsed]
+
+def parse_ingredients_list(ingredients_str, hints=()):
     try:
-        # Evaluate the string to a list
-        ingredients_list = eval(ingredients_str)
+        # Parse the JSON array of ingredient strings
+        ingredients_list = parse_json_list(ingredients_str)
         # Convert each ingredient string to a dictionary
-        return [parse_ingredient(ingredient) for ingredient in ingredients_list]
-    except Exception as e:
-        print(f"Error parsing ingredients: {e}")
+        return [parse_ingredient(ingredient, hints) for ingredient in ingredients_list]
+    except ValueError as e:
+        logger.error("Error parsing ingredients: %s", e)
         return []
 
-def parse_ingredient(ingredient):
-    # Assuming the ingredient is in the form "quantity ingredient_name"
-    parts = ingredient.split(maxsplit=1)
-    if len(parts) == 2:
-        quantity, ingredient_name = parts
-        return {"quantity": quantity, "ingredient": ingredient_name}
-    else:
-        return {"quantity": "", "ingredient": ingredient}
-
+def parse_ingredient(ingredient, hints=()):
+    # Split "quantity [unit] name" and canonicalize the name, using the
+    # recipe's NER names as hints when they are available
+    return ingredient_parser.parse_ingredient(ingredient, hints)
@@ -0,0 +1,397 @@
+# graph_backend.py
+
+import atexit
+import graph_db
+import gzip
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Storage engine behind knowledge_graph: "neo4j" or "memory"
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")
+
+# Optional file the in-memory backend is loaded from and saved to
+MEMORY_GRAPH_PATH = os.getenv("MEMORY_GRAPH_PATH")
+
+class GraphBackend(ABC):
+    """
+    Recipe graph operations used by knowledge_graph. Recipe rows have the
+    shape {'title', 'ingredients': [{'quantity', 'ingredient'}],
+    'directions': [str]}.
+    """
+
+    @abstractmethod
+    def upsert_recipes(self, rows):
+        # Create Products, or replace the ingredients and directions of existing ones
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_ingredients(self, names):
+        # Create Ingredient nodes that do not exist yet
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_pairings(self, rows):
+        # Replace the PAIRS_WITH edges of each {'ingredient', 'pairs': [{'partner', 'count', 'pmi'}]};
+        # edges are only written between ingredients that already exist
+        raise NotImplementedError
+
+    @abstractmethod
+    def fetch_recipe(self, title):
+        # {'title', 'Ingredients', 'directions'} of a stored recipe, or None
+        raise NotImplementedError
+
+    @abstractmethod
+    def ingredient_counts(self):
+        # {ingredient name: number of recipes using it}, for every ingredient
+        raise NotImplementedError
+
+    @abstractmethod
+    def recipes_with_ingredient(self, name):
+        # Titles of the recipes that use an ingredient
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_recipe_ingredient_sets(self):
+        # (title, ingredient names) for every stored recipe
+        raise NotImplementedError
+
+    @contextmanager
+    def batch_writer(self):
+        """
+        Yields a function that writes one batch of recipe rows; backends
+        can hold a connection open for the whole bulk load.
+        """
+        yield self.upsert_recipes
+
+    def ensure_schema(self, force=False):
+        pass
+
+    def close(self):
+        pass
+
+class InMemoryGraphBackend(GraphBackend):
+    """
+    Recipe graph held in indexed dicts: recipes by title and an inverted
+    index from ingredient to recipe titles. Suited to tests, benchmarks of
+    the app logic and single-node deployments with small catalogs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._recipes = {}       # title -> {'ingredients': [(quantity, name)], 'directions': [str]}
+        self._ingredients = {}   # name -> set of recipe titles
+        self._pairings = {}      # name -> [{'partner', 'count', 'pmi'}]
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def upsert_recipes(self, rows):
+        with self._lock:
+            for row in rows:
+                title = row["title"]
+                # A stored recipe's ingredients and directions are replaced, as in Neo4j;
+                # ingredients it no longer uses stay as nodes without this recipe
+                old = self._recipes.get(title)
+                if old is not None:
+                    for _, name in old["ingredients"]:
+                        self._ingredients[name].discard(title)
+                recipe = self._recipes[title] = {"ingredients": [], "directions": list(row.get("directions", []))}
+                for ingredient in row.get("ingredients", []):
+                    name = ingredient["ingredient"]
+                    if not name:
+                        continue
+                    # USED_IN edges are merged on (ingredient, quantity), as in Neo4j
+                    edge = (ingredient.get("quantity") or "", name)
+                    if edge not in recipe["ingredients"]:
+                        recipe["ingredients"].append(edge)
+                    self._ingredients.setdefault(name, set()).add(title)
+        return len(rows)
+
+    def upsert_ingredients(self, names):
+        with self._lock:
+            for name in names:
+                if name:
+                    self._ingredients.setdefault(name, set())
+        return len(names)
+
+    def upsert_pairings(self, rows):
+        with self._lock:
+            for row in rows:
+                if row["ingredient"] in self._ingredients:
+                    self._pairings[row["ingredient"]] = [dict(pair) for pair in row["pairs"]
+                                                         if pair["partner"] in self._ingredients]
+        return len(rows)
+
+    def fetch_recipe(self, title):
+        with self._lock:
+            recipe = self._recipes.get(title)
+            if recipe is None:
+                return None
+            return {
+                "title": title,
+                "Ingredients": [{"quantity": quantity, "ingredient": name}
+                                for quantity, name in recipe["ingredients"]],
+                "directions": list(recipe["directions"]),
+            }
+
+    def ingredient_counts(self):
+        with self._lock:
+            return {name: len(titles) for name, titles in self._ingredients.items()}
+
+    def recipes_with_ingredient(self, name):
+        with self._lock:
+            return sorted(self._ingredients.get(name, ()))
+
+    def iter_recipe_ingredient_sets(self):
+        with self._lock:
+            items = [(title, sorted({name for _, name in recipe["ingredients"]}))
+                     for title, recipe in self._recipes.items()]
+        for title, names in items:
+            if names:
+                yield title, names
+
+    def save(self, path=None):
+        # Write the graph as gzip-compressed JSON, replacing the file atomically
+        path = path or self.path
+        with self._lock:
+            data = {
+                "recipes": [{"title": title, "ingredients": recipe["ingredients"],
+                             "directions": recipe["directions"]}
+                            for title, recipe in self._recipes.items()],
+                "ingredients": list(self._ingredients),
+                "pairings": self._pairings,
+            }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        logger.info("Saved in-memory graph with %d recipes to %s", len(data["recipes"]), path)
+
+    def load(self, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        self.upsert_ingredients(data["ingredients"])
+        self.upsert_pairings([{"ingredient": name, "pairs": pairs}
+                              for name, pairs in data.get("pairings", {}).items()])
+        self.upsert_recipes([
+            {"title": recipe["title"],
+             "ingredients": [{"quantity": quantity, "ingredient": name} for quantity, name in recipe["ingredients"]],
+             "directions": recipe["directions"]}
+            for recipe in data["recipes"]
+        ])
+        logger.info("Loaded in-memory graph with %d recipes from %s", len(self), path)
+
+    def close(self):
+        if self.path:
+            self.save()
+
+# Product, ingredient quantities and ordered steps of one recipe in a single round trip
+FETCH_RECIPE_QUERY = """
+MATCH (p:Product {title: $title})
+RETURN p.title AS title, p.directions AS directions,
+       [(i:Ingredient)-[r:USED_IN]->(p) | {quantity: r.quantity, ingredient: i.name}] AS ingredients,
+       [(p)-[s:HAS_STEP]->(d:Direction) | [s.order, d.description]] AS steps
+"""
+
+# Batched UNWIND queries used by create_knowledge_graph and the bulk loader.
+# Each one handles a whole batch of recipe rows in a single round trip.
+# Rewriting a title replaces its ingredients and steps: the old USED_IN edges and
+# Direction nodes are removed first, in the same transaction.
+_CLEAR_RECIPES_QUERY = """
+UNWIND $titles AS title
+MATCH (p:Product {title: title})
+OPTIONAL MATCH (p)-[:HAS_STEP]->(d:Direction)
+DETACH DELETE d
+WITH DISTINCT p
+OPTIONAL MATCH (:Ingredient)-[u:USED_IN]->(p)
+DELETE u
+"""
+
+_BULK_PRODUCTS_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Product {title: row.title})
+SET p.directions = row.directions
+"""
+
+_BULK_INGREDIENTS_QUERY = """
+UNWIND $names AS name
+MERGE (i:Ingredient {name: name})
+"""
+
+_BULK_USED_IN_QUERY = """
+UNWIND $rows AS row
+MATCH (p:Product {title: row.title})
+UNWIND row.ingredients AS ing
+MATCH (i:Ingredient {name: ing.ingredient})
+MERGE (i)-[r:USED_IN {quantity: ing.quantity}]->(p)
+"""
+
+# A recipe's old Directions are deleted by _CLEAR_RECIPES_QUERY in the same transaction,
+# so every step is created fresh rather than MERGEd on its (order, description)
+_BULK_DIRECTIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (p:Product {title: row.title})
+UNWIND range(0, size(row.directions) - 1) AS idx
+CREATE (p)-[:HAS_STEP {order: idx + 1}]->(:Direction {order: idx + 1, description: row.directions[idx]})
+"""
+
+# Replaces an ingredient's PAIRS_WITH edges with its current top pairings. Ingredients are
+# matched by their stored name, so no node is created for a differently spelled one.
+_PAIRS_WITH_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Ingredient {name: row.ingredient})
+WITH a, row
+OPTIONAL MATCH (a)-[old:PAIRS_WITH]->()
+DELETE old
+WITH DISTINCT a, row
+UNWIND row.pairs AS pair
+MATCH (b:Ingredient {name: pair.partner})
+MERGE (a)-[r:PAIRS_WITH]->(b)
+SET r.count = pair.count, r.pmi = pair.pmi
+"""
+
+def _write_recipe_batch(tx, rows):
+    # When a batch repeats a title, the last row wins, as it would across batches
+    rows = list({row["title"]: row for row in rows}.values())
+    names = sorted({ing["ingredient"] for row in rows for ing in row["ingredients"]})
+    tx.run(_CLEAR_RECIPES_QUERY, titles=[row["title"] for row in rows])
+    tx.run(_BULK_PRODUCTS_QUERY, rows=rows)
+    tx.run(_BULK_INGREDIENTS_QUERY, names=names)
+    tx.run(_BULK_USED_IN_QUERY, rows=rows)
+    tx.run(_BULK_DIRECTIONS_QUERY, rows=rows)
+
+# Uniqueness constraints on the MERGE keys (they also back the index seeks of
+# every Product and Ingredient lookup)
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT product_title IF NOT EXISTS FOR (p:Product) REQUIRE p.title IS UNIQUE",
+    "CREATE CONSTRAINT ingredient_name IF NOT EXISTS FOR (i:Ingredient) REQUIRE i.name IS UNIQUE",
+]
+
+# Representative queries checked by explain_queries, with sample parameters
+SCHEMA_REPORT_QUERIES = {
+    "product by title": ("MATCH (p:Product {title: $title}) RETURN p", {"title": ""}),
+    "ingredient by name": ("MATCH (i:Ingredient {name: $name}) RETURN i", {"name": ""}),
+    "merge ingredient": (_BULK_INGREDIENTS_QUERY, {"names": []}),
+    "merge product": (_BULK_PRODUCTS_QUERY, {"rows": []}),
+    "link ingredients": (_BULK_USED_IN_QUERY, {"rows": []}),
+    "all ingredients": ("MATCH (i:Ingredient) RETURN i.name AS name", {}),
+}
+
+class Neo4jGraphBackend(GraphBackend):
+    """
+    GraphBackend on the shared Neo4j driver of graph_db, using the batched
+    UNWIND queries above.
+    """
+
+    def __init__(self):
+        self._schema_ready = False
+
+    def upsert_recipes(self, rows):
+        graph_db.execute_write(_write_recipe_batch, rows)
+        return len(rows)
+
+    def upsert_ingredients(self, names):
+        graph_db.run_write(_BULK_INGREDIENTS_QUERY, names=list(names))
+        return len(names)
+
+    def upsert_pairings(self, rows):
+        graph_db.run_write(_PAIRS_WITH_QUERY, rows=list(rows))
+        return len(rows)
+
+    def fetch_recipe(self, title):
+        records = graph_db.run_read(FETCH_RECIPE_QUERY, title=title)
+        if not records:
+            return None
+        record = records[0]
+        steps = [description for _, description in sorted(record['steps'], key=lambda step: step[0])]
+        return {
+            'title': record['title'],
+            'Ingredients': [ing for ing in record['ingredients'] if ing['ingredient'] is not None],
+            'directions': steps or list(record['directions'] or [])
+        }
+
+    def ingredient_counts(self):
+        with graph_db.session(read_only=True) as session:
+            result = session.run(
+                "MATCH (i:Ingredient) OPTIONAL MATCH (i)-[r:USED_IN]->() "
+                "RETURN i.name AS name, count(r) AS recipes"
+            )
+            return {record["name"]: record["recipes"] for record in result}
+
+    def recipes_with_ingredient(self, name):
+        records = graph_db.run_read(
+            "MATCH (:Ingredient {name: $name})-[:USED_IN]->(p:Product) RETURN DISTINCT p.title AS title",
+            name=name
+        )
+        return sorted(record["title"] for record in records)
+
+    def iter_recipe_ingredient_sets(self):
+        # Streamed from an auto-commit query so the whole catalog is never held in memory
+        with graph_db.session(read_only=True) as session:
+            result = session.run(
+                "MATCH (i:Ingredient)-[:USED_IN]->(p:Product) "
+                "RETURN p.title AS title, collect(DISTINCT i.name) AS ingredients"
+            )
+            for record in result:
+                yield record['title'], record['ingredients']
+
+    @contextmanager
+    def batch_writer(self):
+        # One session (and pooled connection) for all batches of a bulk load
+        with graph_db.session() as session:
+            yield lambda rows: graph_db.execute_write(_write_recipe_batch, rows, neo4j_session=session)
+
+    def ensure_schema(self, force=False):
+        if self._schema_ready and not force:
+            return
+        with graph_db.session() as session:
+            for statement in SCHEMA_STATEMENTS:
+                try:
+                    session.run(statement).consume()
+                except Exception as e:
+                    # e.g. existing duplicate titles prevent a uniqueness constraint
+                    logger.error("Schema statement failed: %s: %s", statement, e)
+            session.run("CALL db.awaitIndexes()").consume()
+        self._schema_ready = True
+        logger.info("Knowledge graph schema is in place")
+
+    def close(self):
+        graph_db.close_driver()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Return the process-wide backend selected by GRAPH_BACKEND, creating it
+    on first use.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if GRAPH_BACKEND == "memory":
+                    _backend = InMemoryGraphBackend(MEMORY_GRAPH_PATH)
+                    if MEMORY_GRAPH_PATH:
+                        atexit.register(_backend.close)
+                elif GRAPH_BACKEND == "neo4j":
+                    _backend = Neo4jGraphBackend()
+                else:
+                    raise ValueError(f"Unknown GRAPH_BACKEND: {GRAPH_BACKEND}")
+                logger.info("Using %s", type(_backend).__name__)
+    return _backend
+
+def set_backend(backend):
+    # Replace the process-wide backend, e.g. with an InMemoryGraphBackend in benchmarks
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,155 @@
+# graph_db.py
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# Neo4j credentials from environment variables
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE") or None  # None uses the server's default database
+
+# Connection pool settings
+MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))  # seconds
+MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))  # seconds
+
+_driver = None
+_driver_lock = threading.Lock()
+
+class _PoolStats:
+    # Counters behind pool_metrics()
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions_in_use = 0
+        self.sessions_opened = 0
+        self.transactions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+_stats = _PoolStats()
+
+def get_driver():
+    """
+    Return the process-wide Neo4j driver, creating it on first use.
+    """
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(
+                    NEO4J_URI,
+                    auth=(NEO4J_USER, NEO4J_PASSWORD),
+                    max_connection_pool_size=MAX_POOL_SIZE,
+                    connection_acquisition_timeout=ACQUISITION_TIMEOUT,
+                    max_connection_lifetime=MAX_CONNECTION_LIFETIME,
+                )
+                logger.info("Created Neo4j driver for %s (pool size %d)", NEO4J_URI, MAX_POOL_SIZE)
+    return _driver
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+@contextmanager
+def session(read_only=False):
+    """
+    Managed session for operations that run several queries or
+    transactions; it returns its connection to the pool on exit.
+    Args:
+        read_only (bool): Route to readers in a cluster
+    Yields:
+        neo4j.Session
+    """
+    access_mode = READ_ACCESS if read_only else WRITE_ACCESS
+    with get_driver().session(database=NEO4J_DATABASE, default_access_mode=access_mode) as neo4j_session:
+        with _stats.lock:
+            _stats.sessions_in_use += 1
+            _stats.sessions_opened += 1
+        try:
+            yield neo4j_session
+        finally:
+            with _stats.lock:
+                _stats.sessions_in_use -= 1
+
+def _timed(work, requested):
+    # Record the time from asking for a transaction until the work function starts
+    # (connection acquisition plus BEGIN), once per attempt
+    def timed_work(tx, *args, **kwargs):
+        waited = time.perf_counter() - requested
+        with _stats.lock:
+            _stats.transactions += 1
+            _stats.wait_total += waited
+            _stats.wait_max = max(_stats.wait_max, waited)
+        return work(tx, *args, **kwargs)
+    return timed_work
+
+def execute_read(work, *args, neo4j_session=None, **kwargs):
+    """
+    Run work(tx, *args, **kwargs) in a retried read transaction.
+    Args:
+        work (callable): Transaction function; it must consume its results
+        neo4j_session: Managed session to reuse; a new one is opened if None
+    Returns:
+        Whatever work returns
+    """
+    if neo4j_session is not None:
+        return neo4j_session.execute_read(_timed(work, time.perf_counter()), *args, **kwargs)
+    with session(read_only=True) as new_session:
+        return new_session.execute_read(_timed(work, time.perf_counter()), *args, **kwargs)
+
+def execute_write(work, *args, neo4j_session=None, **kwargs):
+    """
+    Run work(tx, *args, **kwargs) in a retried write transaction.
+    Args:
+        work (callable): Transaction function; it must consume its results
+        neo4j_session: Managed session to reuse; a new one is opened if None
+    Returns:
+        Whatever work returns
+    """
+    if neo4j_session is not None:
+        return neo4j_session.execute_write(_timed(work, time.perf_counter()), *args, **kwargs)
+    with session() as new_session:
+        return new_session.execute_write(_timed(work, time.perf_counter()), *args, **kwargs)
+
+def run_read(query, **params):
+    # Single read query; returns the records as a list
+    return execute_read(lambda tx: list(tx.run(query, params)))
+
+def run_write(query, **params):
+    # Single write query; returns the result summary
+    return execute_write(lambda tx: tx.run(query, params).consume())
+
+def pool_metrics():
+    """
+    Pool and session counters, for sizing the pool under load. All of them
+    are kept by this module; the driver's connection pool is internal to it,
+    so sessions in use stand in for connections in use (a session holds at
+    most one connection).
+    Returns:
+        dict: pool size, sessions in use and opened, transactions, and
+            average / maximum wait before a transaction started (connection
+            acquisition plus BEGIN), in milliseconds
+    """
+    with _stats.lock:
+        return {
+            "max_pool_size": MAX_POOL_SIZE,
+            "sessions_in_use": _stats.sessions_in_use,
+            "sessions_opened": _stats.sessions_opened,
+            "transactions": _stats.transactions,
+            "wait_avg_ms": _stats.wait_total / _stats.transactions * 1000 if _stats.transactions else 0.0,
+            "wait_max_ms": _stats.wait_max * 1000,
+        }
@@ -0,0 +1,132 @@
+# ingest_manifest.py
+
+import hashlib
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Location of the local manifest of ingested recipe rows
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.sqlite")
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+def recipe_hash(title, ingredients, directions):
+    """
+    Hash the raw content of a recipe row.
+    Args:
+        title (str): Recipe title
+        ingredients (str): Raw 'ingredients' cell
+        directions (str): Raw 'directions' cell
+    Returns:
+        str: Hex digest identifying this exact recipe content
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (title, ingredients, directions):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+def file_signature(path):
+    # Cheap identity of a CSV file: size and modification time
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+class IngestManifest:
+    """
+    SQLite record of which recipe rows have been written to the graph and
+    how far each source file got, so ingest can skip unchanged rows and
+    resume after a crash.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS recipes (hash TEXT PRIMARY KEY)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            "rows_done INTEGER, completed INTEGER)"
+        )
+        self.conn.commit()
+
+    def unseen(self, hashes):
+        """
+        Args:
+            hashes (list): Row hashes from recipe_hash
+        Returns:
+            set: The hashes that are not yet recorded in the manifest
+        """
+        unique = list(set(hashes))
+        seen = set()
+        for start in range(0, len(unique), _LOOKUP_BATCH):
+            batch = unique[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT hash FROM recipes WHERE hash IN ({placeholders})", batch)
+            seen.update(row[0] for row in rows)
+        return set(unique) - seen
+
+    def record(self, hashes, source=None, rows_done=None):
+        """
+        Mark rows as written and optionally advance the checkpoint of a source
+        file, both in one SQLite transaction.
+        Args:
+            hashes (iterable): Row hashes that were written to the graph
+            source (str): Path of the CSV the rows came from
+            rows_done (int): Number of rows of the source processed so far
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO recipes (hash) VALUES (?)",
+                ((h,) for h in hashes))
+            if source is not None:
+                size, mtime_ns = file_signature(source)
+                self.conn.execute(
+                    "INSERT INTO sources (path, size, mtime_ns, rows_done, completed) "
+                    "VALUES (?, ?, ?, ?, 0) "
+                    "ON CONFLICT(path) DO UPDATE SET size=excluded.size, "
+                    "mtime_ns=excluded.mtime_ns, rows_done=excluded.rows_done, completed=0",
+                    (os.path.abspath(source), size, mtime_ns, rows_done))
+
+    def checkpoint(self, source):
+        """
+        Args:
+            source (str): Path of a CSV file
+        Returns:
+            int: Rows of the file already processed by an interrupted run,
+                or 0 if the file changed or was never started
+        """
+        row = self._source_row(source)
+        if row is None or row[3]:
+            return 0
+        return row[2]
+
+    def is_complete(self, source):
+        # True if the file was fully ingested and has not changed since
+        row = self._source_row(source)
+        return row is not None and bool(row[3])
+
+    def mark_complete(self, source, rows_done):
+        # Record that the whole file was ingested in its current state
+        size, mtime_ns = file_signature(source)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (path, size, mtime_ns, rows_done, completed) "
+                "VALUES (?, ?, ?, ?, 1)",
+                (os.path.abspath(source), size, mtime_ns, rows_done))
+
+    def _source_row(self, source):
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, rows_done, completed FROM sources WHERE path=?",
+            (os.path.abspath(source),)).fetchone()
+        if row is None or (row[0], row[1]) != file_signature(source):
+            return None
+        return row
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,397 @@
+# ingredient_pairings.py
+
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from ingredient_parser import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Directory the batch job writes the pairing counts to and the app loads them from
+PAIRINGS_PATH = os.getenv("INGREDIENT_PAIRINGS_PATH", "ingredient_pairings")
+
+# Pairings kept per ingredient, and the minimum number of shared recipes for a pair to
+# count (PMI overrates pairs seen only a handful of times)
+PAIRINGS_TOP_K = int(os.getenv("INGREDIENT_PAIRINGS_TOP_K", "20"))
+MIN_PAIR_COUNT = int(os.getenv("INGREDIENT_PAIRINGS_MIN_COUNT", "5"))
+
+# Recipes counted per numpy batch, and pair entries held before partial counts are merged
+COUNT_BATCH_SIZE = 50000
+MERGE_ENTRIES = 20_000_000
+
+_ARRAYS = ("item_counts", "pair_codes", "pair_counts")
+_LOW_BITS = np.uint64(0xFFFFFFFF)
+
+def _pack(ids):
+    # Sorted ingredient ids of one recipe as uint32 bytes, the form kept per title
+    return np.asarray(ids, dtype=np.uint32).tobytes()
+
+def _unpack(packed):
+    return np.frombuffer(packed, dtype=np.uint32).tolist()
+
+def _pair_codes_by_size(recipes):
+    # Pair codes (smaller id << 32 | larger id) of recipes given as packed sorted ids;
+    # recipes of the same size are stacked so their pairs are generated in one step
+    by_size = defaultdict(list)
+    for packed in recipes:
+        if len(packed) > 4:
+            by_size[len(packed) // 4].append(packed)
+    codes = []
+    for size, group in by_size.items():
+        matrix = np.frombuffer(b"".join(group), dtype=np.uint32).reshape(-1, size).astype(np.uint64)
+        first, second = np.triu_indices(size, 1)
+        codes.append(((matrix[:, first] << np.uint64(32)) | matrix[:, second]).ravel())
+    return np.concatenate(codes) if codes else np.empty(0, dtype=np.uint64)
+
+def _merge_counts(parts):
+    # Sum (codes, counts) pairs that may share codes into one sorted pair of arrays
+    codes = np.concatenate([part_codes for part_codes, _ in parts])
+    counts = np.concatenate([part_counts for _, part_counts in parts])
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+class PairingIndex:
+    """
+    Ingredient co-occurrence counts and PMI scores.
+
+    The batch counts are held as sorted pair codes (ingredient id << 32 |
+    partner id), stored in both directions so all partners of an ingredient
+    form one contiguous slice, found with a single binary search. Recipes
+    added later are counted in a small per-ingredient dict on top of them.
+    The ingredient ids counted for each title are kept, so writing a title
+    again replaces its counts instead of adding to them.
+    """
+
+    def __init__(self, names=(), item_counts=None, pair_codes=None, pair_counts=None, recipes=0,
+                 top_k=PAIRINGS_TOP_K, min_count=MIN_PAIR_COUNT, spellings=None, recipe_sets=None):
+        self._names = list(names)
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        # Spelling each ingredient was first seen with, used for the names handed out
+        self._spellings = list(spellings) if spellings is not None else list(self._names)
+        self._item_counts = np.zeros(len(self._names), dtype=np.int64) if item_counts is None \
+            else np.array(item_counts, dtype=np.int64)
+        self._pair_codes = np.empty(0, dtype=np.uint64) if pair_codes is None else pair_codes
+        self._pair_counts = np.empty(0, dtype=np.int64) if pair_counts is None else pair_counts
+        self.recipes = recipes
+        self._recipe_sets = recipe_sets if recipe_sets is not None else {}  # title -> packed ids
+        self.top_k = top_k
+        self.min_count = min_count
+        self._recent = defaultdict(Counter)   # ingredient id -> partner id -> pairs added since the batch
+        self._top = {}                        # ingredient id -> cached top-k pairings
+        self._lock = threading.Lock()
+        self.unsaved = False                  # recipes added since the last save()/load()
+
+    def __len__(self):
+        return len(self._names)
+
+    def _id(self, spelling):
+        # Id of an ingredient name, assigned on first sight (called with the lock held)
+        name = normalize_name(spelling)
+        ingredient_id = self._ids.get(name)
+        if ingredient_id is None:
+            ingredient_id = self._ids[name] = len(self._names)
+            self._names.append(name)
+            self._spellings.append(str(spelling).strip())
+            if ingredient_id >= len(self._item_counts):
+                grown = np.zeros(max(16, 2 * len(self._item_counts)), dtype=np.int64)
+                grown[:len(self._item_counts)] = self._item_counts
+                self._item_counts = grown
+        return ingredient_id
+
+    def _count(self, ids, sign):
+        # Add (sign 1) or subtract (sign -1) one recipe's sorted ids (called with the lock held)
+        self.recipes += sign
+        self.unsaved = True
+        self._item_counts[ids] += sign
+        for position, first in enumerate(ids):
+            self._top.pop(first, None)
+            for second in ids[position + 1:]:
+                self._recent[first][second] += sign
+                self._recent[second][first] += sign
+
+    def add_recipes(self, records):
+        """
+        Count new recipes, or recount ones whose title was counted before:
+        the old ingredient set is subtracted and the new one added, so a
+        rewritten recipe is counted once. Cached pairings of the ingredients
+        involved are recomputed on their next lookup; other scores keep the
+        old recipe total until then.
+        Args:
+            records (iterable): (title, ingredient names) pairs; recipes
+                without a title are always counted as new
+        """
+        with self._lock:
+            for title, names in records:
+                ids = sorted({self._id(name) for name in names or () if name and str(name).strip()})
+                if title:
+                    packed = _pack(ids)
+                    old = self._recipe_sets.get(title)
+                    if old == packed:
+                        continue
+                    if old is not None:
+                        self._count(_unpack(old), -1)
+                    if ids:
+                        self._recipe_sets[title] = packed
+                    else:
+                        self._recipe_sets.pop(title, None)
+                if ids:
+                    self._count(ids, 1)
+
+    def add_rows(self, rows):
+        # Write listener for knowledge_graph: rows of {'title', 'ingredients', 'directions'}
+        self.add_recipes((row["title"], [ing["ingredient"] for ing in row["ingredients"]]) for row in rows)
+
+    def _partners(self, ingredient_id):
+        # {partner id: shared recipes} from the batch slice plus the recent counts
+        low = np.uint64(ingredient_id) << np.uint64(32)
+        start = int(self._pair_codes.searchsorted(low, side="left"))
+        end = int(self._pair_codes.searchsorted(low | _LOW_BITS, side="right"))
+        partners = dict(zip((self._pair_codes[start:end] & _LOW_BITS).tolist(),
+                            self._pair_counts[start:end].tolist()))
+        for partner, count in self._recent.get(ingredient_id, {}).items():
+            partners[partner] = partners.get(partner, 0) + count
+        return partners
+
+    def _top_pairings(self, ingredient_id):
+        # Cached [(partner id, pmi, shared recipes)] with the highest PMI among partners seen in
+        # at least min_count recipes (called with the lock held)
+        top = self._top.get(ingredient_id)
+        if top is None:
+            own_count = self._item_counts[ingredient_id]
+            scored = (
+                (math.log(count * self.recipes / (own_count * self._item_counts[partner])), partner, count)
+                for partner, count in self._partners(ingredient_id).items()
+                if count >= max(self.min_count, 1)
+            )
+            top = self._top[ingredient_id] = [(partner, pmi, count) for pmi, partner, count
+                                              in heapq.nlargest(self.top_k, scored)]
+        return top
+
+    def pairings(self, name, k=None):
+        """
+        Ingredients that go well with one ingredient.
+        Args:
+            name (str): Ingredient name
+            k (int): Maximum number of pairings (at most top_k)
+        Returns:
+            list: (partner name, PMI, shared recipes) tuples, best first
+        """
+        with self._lock:
+            ingredient_id = self._ids.get(normalize_name(name))
+            if ingredient_id is None:
+                return []
+            top = self._top_pairings(ingredient_id)[:k or self.top_k]
+            return [(self._spellings[partner], pmi, count) for partner, pmi, count in top]
+
+    def suggest(self, selection, k=5):
+        """
+        Complementary ingredients for a selection: partners of the selected
+        ingredients ranked by their summed PMI, excluding the selection.
+        Args:
+            selection (iterable): Selected ingredient names
+            k (int): Maximum number of suggestions
+        Returns:
+            list: Ingredient names, best first
+        """
+        scores = defaultdict(float)
+        with self._lock:
+            selected = {self._ids[name] for name in map(normalize_name, selection) if name in self._ids}
+            for ingredient_id in selected:
+                for partner, pmi, _ in self._top_pairings(ingredient_id):
+                    if partner not in selected:
+                        scores[partner] += pmi
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [self._spellings[partner] for partner, _ in best]
+
+    def pairing_rows(self):
+        """
+        Yields:
+            dict: {'ingredient', 'pairs': [{'partner', 'count', 'pmi'}]} for
+            every ingredient with pairings, for knowledge_graph.create_pairing_edges
+        """
+        for ingredient_id in range(len(self)):
+            with self._lock:
+                top = self._top_pairings(ingredient_id)
+                if not top:
+                    continue
+                row = {
+                    "ingredient": self._spellings[ingredient_id],
+                    "pairs": [{"partner": self._spellings[partner], "count": count, "pmi": round(pmi, 4)}
+                              for partner, pmi, count in top],
+                }
+            yield row
+
+    @classmethod
+    def from_records(cls, records, batch_size=COUNT_BATCH_SIZE, **kwargs):
+        """
+        Count co-occurrences over (title, ingredient names) pairs, e.g.
+        knowledge_graph.iter_recipe_ingredient_sets() or recommender.recipe_sets_from_csv().
+        A title that appears more than once is counted with its last
+        ingredient set, as the graph keeps the last row written for a title.
+        Pairs are counted per batch with numpy and partial counts are merged
+        as they grow, so memory follows the number of distinct pairs rather
+        than the number of recipes.
+        """
+        started = time.perf_counter()
+        ids = {}
+        spellings = {}
+        recipe_sets = {}
+        untitled = []
+        for title, names in records:
+            recipe = set()
+            for spelling in names or ():
+                name = normalize_name(spelling)
+                if name:
+                    if name not in ids:
+                        ids[name] = len(ids)
+                        spellings[name] = str(spelling).strip()
+                    recipe.add(ids[name])
+            if title:
+                if recipe:
+                    recipe_sets[title] = _pack(sorted(recipe))
+                else:
+                    recipe_sets.pop(title, None)
+            elif recipe:
+                untitled.append(_pack(sorted(recipe)))
+
+        names = sorted(ids, key=ids.get)
+        item_counts = np.zeros(len(names), dtype=np.int64)
+        parts = []
+        buffered = 0
+        counted = list(recipe_sets.values()) + untitled
+        for start in range(0, len(counted), batch_size):
+            batch = counted[start:start + batch_size]
+            item_counts += np.bincount(np.frombuffer(b"".join(batch), dtype=np.uint32), minlength=len(names))
+            unique, counts = np.unique(_pair_codes_by_size(batch), return_counts=True)
+            parts.append((unique, counts.astype(np.int64)))
+            buffered += len(unique)
+            if buffered > MERGE_ENTRIES and len(parts) > 1:
+                parts[:] = [_merge_counts(parts)]
+                buffered = len(parts[0][0])
+
+        # Every pair is kept, rare ones included: min_count is applied when scoring, so a pair
+        # that reaches it through recipes added later is scored on its full count
+        pair_codes, pair_counts = _merge_counts(parts) if parts else (np.empty(0, dtype=np.uint64),
+                                                                      np.empty(0, dtype=np.int64))
+        # Store each pair in both directions, sorted, so an ingredient's partners are contiguous
+        reversed_codes = ((pair_codes & _LOW_BITS) << np.uint64(32)) | (pair_codes >> np.uint64(32))
+        codes = np.concatenate([pair_codes, reversed_codes])
+        order = np.argsort(codes, kind="stable")
+        index = cls(names, item_counts, codes[order], np.concatenate([pair_counts, pair_counts])[order],
+                    len(counted), spellings=[spellings[name] for name in names], recipe_sets=recipe_sets,
+                    **kwargs)
+        logger.info("Counted %d ingredient pairs over %d recipes in %.1fs",
+                    len(pair_codes), len(counted), time.perf_counter() - started)
+        return index
+
+    def _fold_recent(self):
+        # Merge the recent counts into the batch arrays (called with the lock held)
+        if not self._recent:
+            return
+        codes = np.fromiter(((first << 32) | second for first, partners in self._recent.items()
+                             for second in partners), np.uint64)
+        counts = np.fromiter((count for partners in self._recent.values()
+                              for count in partners.values()), np.int64, len(codes))
+        order = np.argsort(codes)
+        pair_codes, pair_counts = _merge_counts([(self._pair_codes, self._pair_counts),
+                                                 (codes[order], counts[order])])
+        # Pairs only seen in recipes that were rewritten since drop to zero
+        kept = pair_counts != 0
+        self._pair_codes, self._pair_counts = pair_codes[kept], pair_counts[kept]
+        self._recent.clear()
+
+    def save(self, path=PAIRINGS_PATH):
+        """
+        Write the counts, including recipes added since the batch run, to a
+        directory of .npy files that load() can memory-map, plus the
+        ingredient set counted for each title. Each file is written next to
+        its target and renamed over it, so an index that memory-maps the
+        previous files keeps reading them.
+        """
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._fold_recent()
+            titles = list(self._recipe_sets)
+            packed = [self._recipe_sets[title] for title in titles]
+            arrays = {"item_counts": self._item_counts[:len(self._names)],
+                      "pair_codes": self._pair_codes, "pair_counts": self._pair_counts}
+            meta = {"names": list(self._names), "spellings": list(self._spellings),
+                    "recipes": self.recipes, "min_count": self.min_count}
+            self.unsaved = False
+        offsets = np.zeros(len(packed) + 1, dtype=np.int64)
+        np.cumsum([len(ids) // 4 for ids in packed], out=offsets[1:])
+        arrays["recipe_ids"] = np.frombuffer(b"".join(packed), dtype=np.uint32)
+        arrays["recipe_offsets"] = offsets
+        for name, array in arrays.items():
+            target = os.path.join(path, f"{name}.npy")
+            with open(f"{target}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{target}.tmp", target)
+        for name, data in (("vocabulary.json", meta), ("titles.json", titles)):
+            target = os.path.join(path, name)
+            with open(f"{target}.tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(f"{target}.tmp", target)
+        logger.info("Saved pairings of %d ingredients to %s", len(meta["names"]), path)
+
+    @classmethod
+    def load(cls, path=PAIRINGS_PATH, mmap=True, **kwargs):
+        """
+        Load counts saved with save(). Recipes added afterwards are counted
+        in memory on top of the (read-only, memory-mapped) batch arrays.
+        """
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS}
+        with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "titles.json"), encoding="utf-8") as f:
+            titles = json.load(f)
+        packed = np.load(os.path.join(path, "recipe_ids.npy")).tobytes()
+        offsets = (np.load(os.path.join(path, "recipe_offsets.npy")) * 4).tolist()
+        recipe_sets = {title: packed[offsets[i]:offsets[i + 1]] for i, title in enumerate(titles)}
+        kwargs.setdefault("min_count", meta["min_count"])
+        return cls(meta["names"], recipes=meta["recipes"], spellings=meta.get("spellings"),
+                   recipe_sets=recipe_sets, **arrays, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {"ingredients": len(self._names), "recipes": self.recipes, "titles": len(self._recipe_sets),
+                    "pairs": len(self._pair_codes) // 2, "cached": len(self._top)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count ingredient co-occurrences and PMI pairings")
+    parser.add_argument("--source", choices=("csv", "graph"), default="csv",
+                        help="Read ingredient sets from the CSV's NER column or from USED_IN edges")
+    parser.add_argument("--path", default="receipes.csv", help="Recipe CSV used with --source csv")
+    parser.add_argument("--out", default=PAIRINGS_PATH, help="Directory to write the counts to")
+    parser.add_argument("--top-k", type=int, default=PAIRINGS_TOP_K)
+    parser.add_argument("--min-count", type=int, default=MIN_PAIR_COUNT)
+    parser.add_argument("--write-edges", action="store_true",
+                        help="Also write the top-k pairings as weighted PAIRS_WITH edges")
+    parser.add_argument("--show", metavar="INGREDIENT", help="Print the pairings of one ingredient")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.source == "graph":
+        from knowledge_graph import iter_recipe_ingredient_sets
+        records = iter_recipe_ingredient_sets()
+    else:
+        from recommender import recipe_sets_from_csv
+        records = recipe_sets_from_csv(args.path)
+    index = PairingIndex.from_records(records, top_k=args.top_k, min_count=args.min_count)
+    index.save(args.out)
+    if args.write_edges:
+        from knowledge_graph import create_pairing_edges
+        create_pairing_edges(index.pairing_rows())
+    if args.show:
+        for partner, pmi, count in index.pairings(args.show):
+            print(f"{partner}\t{pmi:.2f}\t{count}")
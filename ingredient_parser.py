@@ -0,0 +1,151 @@
+# ingredient_parser.py
+
+import argparse
+import logging
+import re
+import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Unit spellings found in recipe text, mapped to a canonical unit name.
+# "T" and "t" are case-sensitive abbreviations and are resolved separately.
+UNITS = {
+    "c": "cup", "cup": "cup", "cups": "cup",
+    "tbsp": "tablespoon", "tbs": "tablespoon", "tbl": "tablespoon", "tablespoon": "tablespoon",
+    "tablespoons": "tablespoon",
+    "tsp": "teaspoon", "teaspoon": "teaspoon", "teaspoons": "teaspoon",
+    "oz": "ounce", "ounce": "ounce", "ounces": "ounce",
+    "lb": "pound", "lbs": "pound", "pound": "pound", "pounds": "pound",
+    "pt": "pint", "pint": "pint", "pints": "pint",
+    "qt": "quart", "quart": "quart", "quarts": "quart",
+    "gal": "gallon", "gallon": "gallon", "gallons": "gallon",
+    "g": "gram", "gram": "gram", "grams": "gram", "kg": "kilogram",
+    "ml": "milliliter", "l": "liter", "liter": "liter", "liters": "liter",
+    "pkg": "package", "pkgs": "package", "package": "package", "packages": "package",
+    "can": "can", "cans": "can", "jar": "jar", "jars": "jar", "box": "box", "boxes": "box",
+    "carton": "carton", "cartons": "carton", "bottle": "bottle", "bottles": "bottle",
+    "envelope": "envelope", "envelopes": "envelope", "bag": "bag", "bags": "bag",
+    "stick": "stick", "sticks": "stick", "clove": "clove", "cloves": "clove",
+    "slice": "slice", "slices": "slice", "dash": "dash", "dashes": "dash",
+    "pinch": "pinch", "pinches": "pinch", "bunch": "bunch", "bunches": "bunch",
+    "head": "head", "heads": "head", "sprig": "sprig", "sprigs": "sprig",
+    "t": "teaspoon",
+}
+_CASE_SENSITIVE_UNITS = {"T": "tablespoon", "t": "teaspoon"}
+
+_UNICODE_FRACTIONS = "½⅓⅔¼¾⅛⅜⅝⅞"
+_NUMBER = rf"(?:\d+\s+\d+/\d+|\d+/\d+|\d+\s*[{_UNICODE_FRACTIONS}]|\d+(?:\.\d+)?|[{_UNICODE_FRACTIONS}])"
+_UNIT_ALTERNATION = "|".join(sorted((re.escape(u) for u in UNITS), key=len, reverse=True))
+
+# amount (mixed fractions and ranges), optional "(16 oz.)" package size, optional unit
+_INGREDIENT_RE = re.compile(
+    rf"""^\s*
+    (?:(?P<amount>{_NUMBER}(?:\s*(?:-|to)\s*{_NUMBER})?)\s*)?
+    (?:\((?P<package>[^)]*)\)\s*)?
+    (?:(?P<unit>{_UNIT_ALTERNATION})(?![a-z])\.?\s+)?
+    (?:of\s+)?
+    (?P<name>.*?)\s*$""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_PARENTHESES_RE = re.compile(r"\([^)]*\)")
+_SPACES_RE = re.compile(r"\s+")
+
+def normalize_name(name):
+    # Ingredient name as compared by the recommenders, the near-duplicate and pairing
+    # indexes and the LLM cache: trimmed and case-folded, otherwise unchanged
+    return str(name).strip().casefold()
+
+@lru_cache(maxsize=1 << 18)
+def clean_name(name):
+    """
+    Reduce an ingredient phrase to a lower-case base name: drop
+    parenthesized notes and anything after the first comma.
+    """
+    name = _PARENTHESES_RE.sub(" ", name).split(",", 1)[0]
+    return _SPACES_RE.sub(" ", name).strip(" .;:-").lower()
+
+@lru_cache(maxsize=1 << 18)
+def split_ingredient(text):
+    """
+    Split an ingredient line into its parts.
+    Args:
+        text (str): e.g. "3 1/2 c. bite size shredded rice biscuits"
+    Returns:
+        tuple: (quantity text, canonical unit, cleaned name), e.g.
+            ("3 1/2 c.", "cup", "bite size shredded rice biscuits")
+    """
+    match = _INGREDIENT_RE.match(text)
+    amount, package, unit, name = match.group("amount", "package", "unit", "name")
+    if unit and not (amount or package):
+        # A leading word that looks like a unit but has no amount is part of the name
+        name = text[match.start("unit"):].strip()
+        unit = None
+    quantity = text[:match.start("name")].strip() if (amount or package or unit) else ""
+    if quantity.lower().endswith(" of"):
+        quantity = quantity[:-3]
+    canonical_unit = None
+    if unit:
+        canonical_unit = _CASE_SENSITIVE_UNITS.get(unit) or UNITS[unit.lower()]
+    return quantity, canonical_unit, clean_name(name)
+
+def _match_hint(name, hints):
+    # Longest NER hint that occurs in the cleaned name as whole words
+    best = None
+    padded = f" {name} "
+    for hint in hints:
+        hint = clean_name(hint)
+        if hint and f" {hint} " in padded and (best is None or len(hint) > len(best)):
+            best = hint
+    return best
+
+def parse_ingredient(text, hints=()):
+    """
+    Parse one ingredient line into quantity, unit and canonical name.
+    Args:
+        text (str): Ingredient line, e.g. "1/2 c. evaporated milk"
+        hints (iterable): Clean ingredient names for the same recipe (the
+            CSV's NER column); the longest one found in the line becomes the
+            canonical name
+    Returns:
+        dict: {'quantity': '1/2 c.', 'unit': 'cup', 'ingredient': 'evaporated milk'};
+            with hints=["milk"] the ingredient is 'milk' instead
+    """
+    quantity, unit, name = split_ingredient(text)
+    if hints:
+        name = _match_hint(name, hints) or name
+    return {"quantity": quantity, "unit": unit, "ingredient": name}
+
+def benchmark(path, chunksize=10000):
+    """
+    Parse every ingredient line of a recipe CSV twice (cold, then warm
+    cache) and report lines per second.
+    """
+    from data_processing import parse_json_list
+    from preprocessing import iter_csv_chunks
+
+    rows = []
+    for chunk in iter_csv_chunks(path, chunksize):
+        for ingredients, ner in zip(chunk["ingredients"], chunk["NER"]):
+            rows.append((parse_json_list(ingredients), parse_json_list(ner)))
+    lines = sum(len(ingredients) for ingredients, _ in rows)
+
+    results = {}
+    split_ingredient.cache_clear()
+    clean_name.cache_clear()
+    for label in ("cold", "warm"):
+        started = time.perf_counter()
+        for ingredients, ner in rows:
+            for line in ingredients:
+                parse_ingredient(line, ner)
+        elapsed = time.perf_counter() - started
+        results[label] = lines / elapsed if elapsed else 0.0
+        logger.info("%s cache: %d lines in %.2fs (%.0f lines/s)", label, lines, elapsed, results[label])
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingredient parser on a recipe CSV")
+    parser.add_argument("path", nargs="?", default="receipes.csv")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    benchmark(args.path)
@@ -0,0 +1,177 @@
+# ingredient_registry.py
+
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+from itertools import chain
+
+logger = logging.getLogger(__name__)
+
+# Write-behind settings for new Ingredient nodes
+FLUSH_INTERVAL = float(os.getenv("INGREDIENT_FLUSH_INTERVAL", "0.5"))  # seconds
+FLUSH_BATCH_SIZE = int(os.getenv("INGREDIENT_FLUSH_BATCH_SIZE", "500"))
+
+# Target number of names per block of the sorted list
+BLOCK_SIZE = 512
+
+class SortedSnapshot:
+    """
+    Read-only, point-in-time view of the registry in sorted order. It holds
+    the registry's immutable blocks, so taking one copies nothing and later
+    inserts do not change it.
+    """
+
+    def __init__(self, blocks, size):
+        self._blocks = blocks
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+class IngredientRegistry:
+    """
+    Set of known ingredient names kept in sorted order.
+
+    Membership is a set lookup. Names are stored in sorted blocks (tuples)
+    so an insert bisects the block index and rebuilds one small block
+    instead of shifting or re-sorting the whole list, and readers can take
+    a snapshot without copying. New names are queued and written to the
+    graph in batches by a background thread (write-behind), so adding an
+    ingredient does not wait for Neo4j.
+    """
+
+    def __init__(self, names=(), writer=None, flush_interval=FLUSH_INTERVAL,
+                 flush_batch_size=FLUSH_BATCH_SIZE):
+        """
+        Args:
+            names (iterable): Names already stored in the graph
+            writer (callable): Called with a list of new names to persist,
+                e.g. knowledge_graph.create_ingredient_nodes; None keeps
+                the registry in memory only
+            flush_interval (float): Seconds between background flushes
+            flush_batch_size (int): Queued names that trigger an early flush
+        """
+        ordered = sorted({name for name in names if name})
+        self._names = set(ordered)
+        self._blocks = tuple(tuple(ordered[i:i + BLOCK_SIZE]) for i in range(0, len(ordered), BLOCK_SIZE))
+        self._maxes = [block[-1] for block in self._blocks]
+        self._listeners = []
+        self._lock = threading.Lock()
+
+        self._writer = writer
+        self._flush_interval = flush_interval
+        self._flush_batch_size = flush_batch_size
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def add_listener(self, listener):
+        # Called with each newly added name, e.g. IngredientSearchIndex.add
+        self._listeners.append(listener)
+
+    def add(self, name):
+        """
+        Add an ingredient name.
+        Args:
+            name (str): Ingredient name
+        Returns:
+            bool: True if the name was new
+        """
+        name = (name or "").strip()
+        if not name or name in self._names:
+            return False
+        with self._lock:
+            if name in self._names:
+                return False
+            self._insert(name)
+            self._names.add(name)
+            if self._writer is not None:
+                self._pending.append(name)
+                self._start_flusher()
+                if len(self._pending) >= self._flush_batch_size:
+                    self._wakeup.set()
+        for listener in self._listeners:
+            listener(name)
+        logger.debug("Added new ingredient: %s", name)
+        return True
+
+    def _insert(self, name):
+        # Replace one block (split when it grows too large) and publish a new block tuple
+        blocks = self._blocks
+        if not blocks:
+            self._blocks, self._maxes = ((name,),), [name]
+            return
+        position = min(bisect.bisect_left(self._maxes, name), len(blocks) - 1)
+        block = list(blocks[position])
+        bisect.insort(block, name)
+        if len(block) > 2 * BLOCK_SIZE:
+            replacement = (tuple(block[:BLOCK_SIZE]), tuple(block[BLOCK_SIZE:]))
+        else:
+            replacement = (tuple(block),)
+        maxes = self._maxes[:position] + [part[-1] for part in replacement] + self._maxes[position + 1:]
+        self._blocks = blocks[:position] + replacement + blocks[position + 1:]
+        self._maxes = maxes
+
+    def snapshot(self):
+        """
+        Returns:
+            SortedSnapshot: All names in sorted order as of this call
+        """
+        with self._lock:
+            return SortedSnapshot(self._blocks, len(self._names))
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="ingredient-writer", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Write queued names to the graph now. Names whose write fails are
+        queued again for the next flush.
+        Returns:
+            int: Number of names written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            try:
+                self._writer(batch)
+            except Exception as e:
+                logger.error("Error writing %d new ingredients, will retry: %s", len(batch), e)
+                with self._lock:
+                    self._pending[:0] = batch
+                return 0
+            logger.debug("Wrote %d new ingredients in %.1f ms", len(batch), (time.perf_counter() - started) * 1000)
+            return len(batch)
+
+    def close(self):
+        # Stop the background writer and flush what is still queued
+        self._closed = True
+        self._wakeup.set()
+        if self._writer is not None:
+            self.flush()
@@ -0,0 +1,208 @@
+# ingredient_search.py
+
+import argparse
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Number of matches returned per page of search results
+SEARCH_PAGE_SIZE = int(os.getenv("INGREDIENT_SEARCH_PAGE_SIZE", "50"))
+
+# Minimum trigram similarity of a fuzzy match
+FUZZY_THRESHOLD = float(os.getenv("INGREDIENT_SEARCH_FUZZY_THRESHOLD", "0.3"))
+
+def _normalize(name):
+    return " ".join(str(name).casefold().split())
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class IngredientSearchIndex:
+    """
+    In-process autocomplete index over ingredient names. Prefix matches
+    come from a sorted array searched with bisect, substring and fuzzy
+    matches from a trigram index. Within each kind, matches are ranked by
+    popularity (number of recipes using the ingredient). Until the trigram
+    index has been built (see build_trigrams), only prefix matches are
+    returned.
+    """
+
+    def __init__(self):
+        self._keys = []              # sorted normalized names
+        self._names = {}             # normalized name -> display name
+        self._popularity = {}        # normalized name -> recipe count
+        self._trigram_index = defaultdict(set)
+        self._trigrams_ready = True
+        self._popular = None         # all names by popularity, for empty queries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return _normalize(name) in self._names
+
+    def add(self, name, popularity=0):
+        """
+        Add an ingredient, or raise the popularity of a known one.
+        Args:
+            name (str): Ingredient name as displayed
+            popularity (int): Number of recipes using it
+        """
+        key = _normalize(name)
+        if not key:
+            return
+        with self._lock:
+            if key in self._names:
+                if popularity > self._popularity[key]:
+                    self._popularity[key] = popularity
+                    self._popular = None
+                return
+            bisect.insort(self._keys, key)
+            self._names[key] = name
+            self._popularity[key] = popularity
+            self._popular = None
+            if self._trigrams_ready:
+                for trigram in _trigrams(key):
+                    self._trigram_index[trigram].add(key)
+
+    def search(self, query, page=0, page_size=SEARCH_PAGE_SIZE):
+        """
+        Find ingredients matching a query.
+        Args:
+            query (str): Text typed by the user
+            page (int): Zero-based page number
+            page_size (int): Matches per page
+        Returns:
+            tuple: (names on the requested page, total number of matches)
+        """
+        query = _normalize(query)
+        with self._lock:
+            if not query:
+                if self._popular is None:
+                    self._popular = self._by_popularity(self._names)
+                ranked = self._popular
+            else:
+                ranked = self._rank(query)
+            start = page * page_size
+            return [self._names[key] for key in ranked[start:start + page_size]], len(ranked)
+
+    def _rank(self, query):
+        # Prefix matches, then names containing the query, then fuzzy matches
+        start = bisect.bisect_left(self._keys, query)
+        end = bisect.bisect_left(self._keys, query + "\uffff", start)
+        prefix = set(self._keys[start:end])
+        if not self._trigrams_ready:
+            return self._by_popularity(prefix)
+
+        query_trigrams = _trigrams(query)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for key in self._trigram_index.get(trigram, ()):
+                shared[key] += 1
+
+        substring, fuzzy = [], {}
+        for key, count in shared.items():
+            if key in prefix:
+                continue
+            if query in key:
+                substring.append(key)
+                continue
+            similarity = count / (len(query_trigrams) + len(key) + 1 - count)
+            if similarity >= FUZZY_THRESHOLD:
+                fuzzy[key] = similarity
+        fuzzy_ranked = sorted(fuzzy, key=lambda key: (-fuzzy[key], -self._popularity[key], key))
+        return self._by_popularity(prefix) + self._by_popularity(substring) + fuzzy_ranked
+
+    def _by_popularity(self, keys):
+        return sorted(keys, key=lambda key: (-self._popularity[key], key))
+
+    def build_trigrams(self):
+        """
+        Build the trigram index used for substring and fuzzy matches. This
+        is the slow part of building an index (about a second per 100k
+        names), so it runs without holding the lock and can be done on a
+        background thread while prefix search is already served.
+        """
+        with self._lock:
+            if self._trigrams_ready:
+                return
+            keys = list(self._keys)
+        trigram_index = defaultdict(set)
+        for key in keys:
+            for trigram in _trigrams(key):
+                trigram_index[trigram].add(key)
+        with self._lock:
+            # Names added while the index was being built
+            for key in self._names.keys() - set(keys):
+                for trigram in _trigrams(key):
+                    trigram_index[trigram].add(key)
+            self._trigram_index = trigram_index
+            self._trigrams_ready = True
+        logger.info("Ingredient trigram index built for %d names", len(keys))
+
+    @classmethod
+    def from_counts(cls, counts, trigrams=True):
+        """
+        Build an index from {ingredient name: recipe count}, e.g. a
+        vocabulary snapshot.
+        Args:
+            counts (dict): Ingredient name -> recipe count
+            trigrams (bool): Build the trigram index now; with False, call
+                build_trigrams() later to enable substring and fuzzy matches
+        """
+        index = cls()
+        index._trigrams_ready = False
+        for name, popularity in counts.items():
+            key = _normalize(name)
+            if key and popularity >= index._popularity.get(key, -1):
+                index._names[key] = name
+                index._popularity[key] = popularity
+        index._keys = sorted(index._names)
+        if trigrams:
+            index.build_trigrams()
+        logger.info("Ingredient search index built with %d names", len(index))
+        return index
+
+def benchmark(size=100000, queries=1000):
+    """
+    Time index build and search latency over synthetic ingredient names.
+    """
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+             for _ in range(5000)]
+    counts = {f"{rng.choice(words)} {rng.choice(words)}": rng.randint(1, 1000) for _ in range(size)}
+
+    started = time.perf_counter()
+    index = IngredientSearchIndex.from_counts(counts, trigrams=False)
+    logger.info("Built prefix index of %d names in %.2fs", len(index), time.perf_counter() - started)
+    started = time.perf_counter()
+    index.build_trigrams()
+    logger.info("Built trigram index in %.2fs", time.perf_counter() - started)
+
+    names = list(counts)
+    timings = []
+    for _ in range(queries):
+        name = rng.choice(names)
+        query = name[:rng.randint(2, len(name))]
+        started = time.perf_counter()
+        index.search(query)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    for label, share in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        logger.info("search %s: %.2f ms", label, timings[int(share * (len(timings) - 1))] * 1000)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ingredient search index")
+    parser.add_argument("--size", type=int, default=100000, help="Number of ingredient names")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    benchmark(args.size, args.queries)
@@ -1,131 +1,293 @@
 # knowledge_graph.py 
 
-from neo4j import GraphDatabase
+import graph_db
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
+from graph_backend import SCHEMA_REPORT_QUERIES, get_backend
+from metrics import timed, counter
 
 # Import the updated parse_ingredient function
 from data_processing import parse_ingredient
+from ingredient_parser import clean_name
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from the .env file
 load_dotenv()
 
-# Neo4j credentials from environment variables
-neo4j_uri = os.getenv("NEO4J_URI")
-neo4j_username = os.getenv("NEO4J_USER", "neo4j")  # Default to 'neo4j' if NEO4J_USER is not set
-neo4j_password = os.getenv("NEO4J_PASSWORD")
-
-# Initialize the driver
-driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_username, neo4j_password))
-
-# Initialize Neo4j driver (replace with your actual connection setup)
-neo4j_uri = os.getenv("NEO4J_URI")
-neo4j_username = os.getenv("NEO4J_USER", "neo4j")
-neo4j_password = os.getenv("NEO4J_PASSWORD")
-driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_username, neo4j_password))
-
-# Function to create a knowledge graph entry for a new recipe
-# def create_knowledge_graph(title, ingredients, directions):
-#     with driver.session() as session:
-#         session.write_transaction(_create_recipe, title, ingredients, directions)
-
-def _create_recipe(tx, title, ingredients, directions):
-    # Create recipe node
-    tx.run("CREATE (r:Recipe {title: $title, directions: $directions})",
-           title=title, directions=directions)
-    # Create and link ingredient nodes
-    for ingredient in ingredients:
-        tx.run("MATCH (r:Recipe {title: $title}) "
-               "MERGE (i:Ingredient {name: $ingredient}) "
-               "MERGE (i)-[:USED_IN]->(r)",
-               title=title, ingredient=ingredient['ingredient'])
+# Number of recipe rows sent per UNWIND transaction by bulk_load_recipes
+BULK_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", "1000"))
+
+# Callbacks run after recipes are committed, e.g. to keep in-memory indexes current
+_write_listeners = []
+
+def add_write_listener(listener):
+    """
+    Register a callback invoked with the list of written recipe rows
+    ({'title', 'ingredients', 'directions'}) after every committed write.
+    """
+    _write_listeners.append(listener)
+
+def _notify_write(rows):
+    for listener in _write_listeners:
+        try:
+            listener(rows)
+        except Exception as e:
+            logger.error("Write listener %r failed: %s", listener, e)
+
+# Maximum number of recipes (and known misses) kept by the read-through cache; 0 disables it
+RECIPE_CACHE_ENTRIES = int(os.getenv("RECIPE_CACHE_ENTRIES", "4096"))
+
+class RecipeCache:
+    """
+    Read-through LRU cache of fetched recipes, keyed by title. Misses are
+    cached too, so repeated "does this recipe exist" checks for new titles
+    skip the database. Entries are dropped when this process writes the
+    same title; writes made by other processes are not seen.
+    """
+
+    def __init__(self, max_entries=RECIPE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, title, load):
+        with self._lock:
+            if title in self._entries:
+                self._entries.move_to_end(title)
+                self.hits += 1
+                return self._entries[title]
+            self.misses += 1
+            generation = self._generation
+        value = load(title)
+        with self._lock:
+            # Skip storing if a write invalidated the cache while loading
+            if generation == self._generation and self.max_entries > 0:
+                self._entries[title] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, titles):
+        with self._lock:
+            self._generation += 1
+            for title in titles:
+                self._entries.pop(title, None)
+
+    def invalidate_rows(self, rows):
+        # Write listener
+        self.invalidate([row["title"] for row in rows])
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+recipe_cache = RecipeCache()
+add_write_listener(recipe_cache.invalidate_rows)
+
+# Function to get a stored Product with its ingredient quantities and ordered steps
+def get_product_from_kg(title):
+    """
+    Fetch a stored recipe, or None if no Product has this title.
+    Returns:
+        dict: {'title', 'Ingredients': [{'quantity', 'ingredient'}], 'directions'}
+    """
+    return recipe_cache.get_or_load(title, get_backend().fetch_recipe)
 
 # Function to check if a recipe exists in the KG
-def check_recipe_exists(title, ingredients):
-    with driver.session() as session:
-        result = session.run(
-            "MATCH (r:Recipe {title: $title})-[:USED_IN]->(i:Ingredient) "
-            "WHERE i.name IN $ingredients "
-            "RETURN r.title, collect(i.name) as ingredients",
-            title=title,
-            ingredients=ingredients
-        )
-        return result.single() is not None
+def check_recipe_exists(title, ingredients=None):
+    return get_product_from_kg(title) is not None
 
 # Function to get recipe details from KG if it exists
-def get_recipe_from_kg(title, ingredients):
-    with driver.session() as session:
-        result = session.run(
-            "MATCH (r:Recipe {title: $title})-[:USED_IN]->(i:Ingredient) "
-            "WHERE i.name IN $ingredients "
-            "RETURN r.title as title, r.directions as directions, collect(i.name) as ingredients",
-            title=title,
-            ingredients=ingredients
-        )
-        record = result.single()
-        if record:
-            return {
-                'title': record['title'],
-                'Ingredients': [{'ingredient': ing} for ing in record['ingredients']],
-                'directions': record['directions']
-            }
-        return None
-    
-    
+def get_recipe_from_kg(title, ingredients=None):
+    return get_product_from_kg(title)
+
+# Function to stream (title, ingredient names) for every stored Product
+def iter_recipe_ingredient_sets():
+    return get_backend().iter_recipe_ingredient_sets()
+
+# Function to get {ingredient name: number of recipes using it} for every ingredient
+def get_ingredient_counts():
+    return get_backend().ingredient_counts()
+
+# Function to get the titles of the recipes that use an ingredient
+def get_recipes_with_ingredient(name):
+    return get_backend().recipes_with_ingredient(name)
+
 def create_knowledge_graph(recipe_title, ingredients, directions):
-    
-    with driver.session() as session:
-        if ingredients == [] and directions == []:
-            return session.write_transaction(_create_ingredient_node, recipe_title)
-        # Create a Product node with title and directions properties
-        session.write_transaction(_create_product_node, recipe_title, directions)
-        
-        for ingredient in ingredients:
-            quantity = ingredient.get("quantity", "")
-            ingredient_name = ingredient.get("ingredient", "")
-            
-            # Create an Ingredient node
-            session.write_transaction(_create_ingredient_node, ingredient_name)
-            
-            # Create a relationship from Ingredient to Product
-            session.write_transaction(_create_used_in_relationship, ingredient_name, recipe_title, quantity)
-        
-        for i, step in enumerate(directions, start=1):
-            # Create a Direction node
-            session.write_transaction(_create_direction_node, recipe_title, i, step)
-
-def _create_product_node(tx, title, directions):
-    query = """
-    MERGE (p:Product {title: $title})
-    SET p.directions = $directions
-    """
-    tx.run(query, title=title, directions=directions)
-
-def _create_ingredient_node(tx, name):
-    query = """
-    MERGE (i:Ingredient {name: $name})
-    """
-    tx.run(query, name=name)
-
-def _create_used_in_relationship(tx, ingredient_name, product_title, quantity):
-    query = """
-    MATCH (i:Ingredient {name: $ingredient_name})
-    MATCH (p:Product {title: $product_title})
-    MERGE (i)-[r:USED_IN {quantity: $quantity}]->(p)
-    """
-    tx.run(query, ingredient_name=ingredient_name, product_title=product_title, quantity=quantity)
-
-def _create_direction_node(tx, product_title, order, description):
-    query = """
-    MATCH (p:Product {title: $product_title})
-    CREATE (d:Direction {order: $order, description: $description})
-    CREATE (p)-[:HAS_STEP {order: $order}]->(d)
-    """
-    tx.run(query, product_title=product_title, order=order, description=description)
+    """
+    Write one recipe (Product, Ingredients, USED_IN edges and Directions) in
+    a single transaction, replacing the ingredients and steps of a stored
+    recipe with the same title. With no ingredients and no directions, only
+    an Ingredient node named recipe_title is created.
+    """
+    if ingredients == [] and directions == []:
+        get_backend().upsert_ingredients([recipe_title])
+        return
+    row = _to_bulk_row({"title": recipe_title, "ingredients": ingredients, "directions": directions})
+    with timed("graph_write"):
+        get_backend().upsert_recipes([row])
+    _notify_write([row])
+
+def create_knowledge_graphs(recipes):
+    """
+    Write several recipes in a single transaction.
+    Args:
+        recipes (list): Dicts with 'title', 'ingredients' (list of
+            {'quantity', 'ingredient'}) and 'directions' (list of str)
+    Returns:
+        int: Number of recipes written
+    """
+    rows = [_to_bulk_row(recipe) for recipe in recipes if recipe.get("title")]
+    if not rows:
+        return 0
+    with timed("graph_write"):
+        get_backend().upsert_recipes(rows)
+    _notify_write(rows)
+    return len(rows)
+
+def create_ingredient_nodes(names):
+    """
+    Merge a batch of Ingredient nodes in a single transaction, under
+    their canonical names (see ingredient_parser.clean_name).
+    Args:
+        names (list): Ingredient names
+    Returns:
+        int: Number of names written
+    """
+    names = [name for name in map(clean_name, filter(None, names)) if name]
+    if not names:
+        return 0
+    get_backend().upsert_ingredients(names)
+    return len(names)
+
+def create_pairing_edges(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Write weighted PAIRS_WITH edges in batches, replacing each ingredient's
+    previous ones.
+    Args:
+        rows (iterable): {'ingredient', 'pairs': [{'partner', 'count', 'pmi'}]},
+            e.g. ingredient_pairings.PairingIndex.pairing_rows()
+        batch_size (int): Ingredients written per transaction
+    Returns:
+        int: Number of ingredients whose pairings were written
+    """
+    backend = get_backend()
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            written += backend.upsert_pairings(batch)
+            batch = []
+    if batch:
+        written += backend.upsert_pairings(batch)
+    logger.info("Wrote PAIRS_WITH edges for %d ingredients", written)
+    return written
+
+def _to_bulk_row(recipe):
+    # Normalise a recipe dict into the shape expected by the UNWIND queries. Ingredient names
+    # are reduced to the canonical name the CSV ingest writes, so a recipe from the LLM
+    # ("Evaporated Milk") links to the same Ingredient node ("evaporated milk").
+    ingredients = []
+    for ing in recipe.get("ingredients", []):
+        name = clean_name(str(ing.get("ingredient") or ""))
+        if name:
+            ingredients.append({"ingredient": name, "quantity": ing.get("quantity") or ""})
+    return {
+        "title": recipe["title"],
+        "ingredients": ingredients,
+        "directions": list(recipe.get("directions", [])),
+    }
+
+# Recipes written by bulk_load_recipes
+INGESTED_RECIPES = counter("ingest_recipes_total", "Recipes written by bulk loads")
+
+def bulk_load_recipes(recipes, batch_size=BULK_BATCH_SIZE):
+    """
+    Write recipes to the knowledge graph in batched UNWIND transactions.
+    Args:
+        recipes (iterable): Dicts with 'title', 'ingredients' (list of
+            {'quantity', 'ingredient'}) and 'directions' (list of str)
+        batch_size (int): Number of recipes written per transaction
+    Returns:
+        int: Number of recipes written
+    """
+    ensure_schema()
+    written = 0
+    batch = []
+    started = time.perf_counter()
+
+    def flush(write):
+        nonlocal written, batch
+        with timed("ingest_batch"):
+            write(batch)
+        _notify_write(batch)
+        INGESTED_RECIPES.inc(len(batch))
+        written += len(batch)
+        elapsed = time.perf_counter() - started
+        logger.info("Bulk load: %d recipes written in %.1fs "
+                    "(%.0f recipes/s)", written, elapsed, written / elapsed if elapsed else 0)
+        batch = []
+
+    with get_backend().batch_writer() as write:
+        for recipe in recipes:
+            if not recipe.get("title"):
+                continue
+            batch.append(_to_bulk_row(recipe))
+            if len(batch) >= batch_size:
+                flush(write)
+        if batch:
+            flush(write)
+    return written
+
+def ensure_schema(force=False):
+    """
+    Create the uniqueness constraints of the recipe graph if they are
+    missing. Safe to call repeatedly; runs once per process unless forced.
+    """
+    get_backend().ensure_schema(force)
+
+def _plan_operators(plan):
+    # Flatten an EXPLAIN plan into operator names without the '@neo4j' suffix
+    operators = [plan["operatorType"].split("@")[0]]
+    for child in plan.get("children", []):
+        operators.extend(_plan_operators(child))
+    return operators
+
+def explain_queries(queries=None):
+    """
+    Report whether each query starts from an index seek or a scan.
+    Args:
+        queries (dict): name -> (cypher, params); defaults to SCHEMA_REPORT_QUERIES
+    Returns:
+        dict: name -> {'access': 'seek' | 'scan' | 'other', 'operators': [...]}
+    """
+    report = {}
+    with graph_db.session(read_only=True) as session:
+        for name, (query, params) in (queries or SCHEMA_REPORT_QUERIES).items():
+            plan = session.run("EXPLAIN " + query, **params).consume().plan
+            operators = _plan_operators(plan)
+            if any("Seek" in op for op in operators):
+                access = "seek"
+            elif any("Scan" in op for op in operators):
+                access = "scan"
+            else:
+                access = "other"
+            report[name] = {"access": access, "operators": operators}
+            logger.info("%s: %s (%s)", name, access, ' <- '.join(operators))
+    return report
 
 # Don't forget to close the driver when you're done
 def close_driver():
-    driver.close()
+    get_backend().close()
 
 # Example usage (remove this part in production)
 # create_knowledge_graph("Sample Recipe", [{"quantity": "1 cup", "ingredient": "Sugar"}], ["Step 1: Mix ingredients."])
@@ -0,0 +1,146 @@
+# llm_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ingredient_parser import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Cache settings from environment variables
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", "100000"))
+# Share of LLM_CACHE_DISK_ENTRIES kept when the SQLite table goes over the cap
+DISK_EVICT_TO = 0.9
+
+def normalize_ingredients(ingredients):
+    # Sorted, case-folded, de-duplicated ingredient names
+    return sorted({normalize_name(name) for name in ingredients} - {""})
+
+def make_cache_key(ingredients, model, response_format, temperature):
+    """
+    Build the cache key of a recipe request.
+    Args:
+        ingredients (iterable): Ingredient names the recipe was asked for
+        model (str): Model name
+        response_format (dict): Response format / JSON schema sent to the model
+        temperature (float): Sampling temperature
+    Returns:
+        str: Hex digest identifying the normalized request
+    """
+    payload = json.dumps({
+        "ingredients": normalize_ingredients(ingredients),
+        "model": model,
+        "response_format": response_format,
+        "temperature": temperature,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache of parsed model responses: an in-memory LRU in front of
+    a SQLite table. Entries expire after `ttl` seconds and each tier is
+    capped at a maximum number of entries. Both tiers hold the JSON text,
+    so every get() returns a new object that callers may modify.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, memory_entries=CACHE_MEMORY_ENTRIES,
+                 disk_entries=CACHE_DISK_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        # Upper bound on the table's rows (a replaced key is counted twice until the next
+        # eviction recounts), so the table is only counted once it may exceed the cap
+        self._disk_rows = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Returns:
+            The cached value, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return json.loads(entry[1])
+
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key=?", (key,)).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    with self._conn:
+                        self._conn.execute("DELETE FROM responses WHERE key=?", (key,))
+                    self._disk_rows -= 1
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+
+            with self._conn:
+                self._conn.execute("UPDATE responses SET accessed=? WHERE key=?", (now, key))
+            self._remember(key, row[1], row[0])
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        text = json.dumps(value)
+        with self._lock:
+            self._remember(key, now, text)
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) "
+                    "VALUES (?, ?, ?, ?)", (key, text, now, now))
+                self._disk_rows += 1
+                if self._disk_rows > self.disk_entries:
+                    self._evict_disk()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.hits - self.memory_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def _remember(self, key, created, text):
+        self._memory[key] = (created, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Drop expired rows, then the least recently used ones down to DISK_EVICT_TO of the
+        # cap, so the next eviction is a tenth of the cap's writes away
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        rows = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = rows - int(self.disk_entries * DISK_EVICT_TO) if rows > self.disk_entries else 0
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,))
+        self._disk_rows = rows - excess
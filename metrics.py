@@ -0,0 +1,210 @@
+# metrics.py
+
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Port of the Prometheus endpoint; unset or 0 leaves it off
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# APP_TRACE_IDS=1 tags each request's stage timings in the debug log with a trace id
+TRACE_IDS = os.getenv("APP_TRACE_IDS", "0") == "1"
+
+# Histogram buckets in seconds, from a cache hit to a slow LLM call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        labelnames = self.labelnames + ("le",)
+        with self._lock:
+            for labelvalues, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(labelnames, labelvalues + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(labelnames, labelvalues + ('+Inf',))} {series[-1]}")
+                labels = _format_labels(self.labelnames, labelvalues)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+class Gauge:
+    """
+    Value read when metrics are scraped. The callback returns a number, or
+    a dict of {label value: number} for a gauge with one label.
+    """
+
+    def __init__(self, name, help, callback, labelname=None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelname = labelname
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.error("Gauge %s failed: %s", self.name, e)
+            return lines
+        if isinstance(value, dict):
+            for labelvalue, number in sorted(value.items()):
+                if number is not None:
+                    lines.append(f'{self.name}{{{self.labelname}="{_escape(labelvalue)}"}} {number}')
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+def gauge(name, help, callback, labelname=None):
+    return _register(Gauge(name, help, callback, labelname))
+
+# Per-stage latency of the recipe request pipeline and ingest
+STAGE_SECONDS = histogram("recipe_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+STAGE_ERRORS = counter("recipe_stage_errors_total", "Pipeline stages that raised an exception", ("stage",))
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+def start_trace():
+    """
+    Give the current request a trace id when APP_TRACE_IDS=1.
+    Returns:
+        str: The trace id, or None when trace ids are off
+    """
+    trace_id = uuid.uuid4().hex[:16] if TRACE_IDS else None
+    _trace_id.set(trace_id)
+    return trace_id
+
+def current_trace_id():
+    return _trace_id.get()
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block into recipe_stage_seconds{stage=...}. Exceptions are
+    counted in recipe_stage_errors_total and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(1, stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage)
+        if logger.isEnabledFor(logging.DEBUG):
+            trace_id = _trace_id.get()
+            logger.debug("%s%s took %.1f ms", f"[{trace_id}] " if trace_id else "", stage, elapsed * 1000)
+
+def render():
+    # All registered metrics in the Prometheus text exposition format
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve /metrics on a background thread. Does nothing if port is 0 or a
+    server is already running.
+    Returns:
+        ThreadingHTTPServer: The server, or None
+    """
+    global _server
+    if not port or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Metrics available at http://%s:%d/metrics", host, _server.server_address[1])
+    return _server
@@ -1,16 +1,21 @@
 #model_call.py
 
 import openai
+import asyncio
 import json
 import logging
 import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from llm_cache import ResponseCache, make_cache_key
+from metrics import timed, STAGE_SECONDS
 # Load environment variables from the .env file
 load_dotenv()
 
 # Initialize logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # API Keys and URLs from environment variables
@@ -18,39 +23,252 @@ KOLANK_API_KEY = os.getenv("KOLANK_API_KEY")
 KOLANK_URL = os.getenv("KOLANK_URL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Model settings used for Kolank requests
+KOLANK_MODEL = "Openai/gpt-4o-mini"
+KOLANK_TEMPERATURE = 0.2
+KOLANK_MAX_TOKENS = 1024
+
+# Limits for concurrent batch requests
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
 # Set OpenAI API key
 openai.api_key = OPENAI_API_KEY
 
-# Log setup information
-logging.info(f"KOLANK_API_KEY: {KOLANK_API_KEY}")
-logging.info(f"KOLANK_URL: {KOLANK_URL}")
-logging.info(f"OPENAI_API_KEY: {OPENAI_API_KEY}")
+# Cache of parsed responses, keyed on the normalized ingredient set (LLM_CACHE=0 disables it)
+LLM_CACHE = os.getenv("LLM_CACHE", "1") != "0"
+
+# Log setup information (never the keys themselves)
+logger.info("Kolank endpoint: %s (API key %s)", KOLANK_URL, "set" if KOLANK_API_KEY else "missing")
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    # Shared Kolank client, so every call reuses the same HTTP connection pool
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(base_url=KOLANK_URL, api_key=KOLANK_API_KEY)
+    return _client
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    # Shared response cache, opened on first use so importing this module touches no files;
+    # None when LLM_CACHE=0
+    global _response_cache
+    if _response_cache is None and LLM_CACHE:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
 
 # Function for calling Kolank API using OpenAI
-def call_kolank_api(messages, response_format={ "type": "json_object" }):
+def call_kolank_api(messages, response_format={ "type": "json_object" }, cache_ingredients=None):
+    """
+    Args:
+        messages (list): Chat messages sent to the model
+        response_format (dict): Response format / JSON schema
+        cache_ingredients (list): Ingredient set the request is about; when
+            given, the response is served from and stored in the response cache
+    Returns:
+        dict: Parsed JSON response, or None on error
+    """
+    cache_key = None
+    response_cache = get_response_cache() if cache_ingredients is not None else None
+    if response_cache is not None:
+        cache_key = make_cache_key(cache_ingredients, KOLANK_MODEL, response_format, KOLANK_TEMPERATURE)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Kolank response served from cache")
+            return cached
+
     try:
-        client = OpenAI(base_url=KOLANK_URL, api_key=KOLANK_API_KEY)
-        response = client.chat.completions.create(
-            model="Openai/gpt-4o-mini",
-            messages=messages,
-            max_tokens=1024,
-            temperature=0.2,
-            response_format=response_format
-        )
+        with timed("llm_call"):
+            response = get_client().chat.completions.create(
+                model=KOLANK_MODEL,
+                messages=messages,
+                max_tokens=KOLANK_MAX_TOKENS,
+                temperature=KOLANK_TEMPERATURE,
+                response_format=response_format
+            )
         json_response = response.choices[0].message.content
-        logger.debug(f"Kolank Model response: {json_response}")
+        logger.debug("Kolank Model response: %s", json_response)
 
         data = json.loads(json_response)  # Parse the JSON response
 
     except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error: {e}")
+        logger.error("JSON decode error: %s", e)
         data = None
     except Exception as e:
-        logger.error(f"Error calling Kolank API: {e}")
+        logger.error("Error calling Kolank API: %s", e)
         data = None
 
+    if cache_key is not None and data is not None:
+        response_cache.set(cache_key, data)
     return data
 
+# Function for streaming a Kolank completion as it is generated
+def stream_kolank_api(messages, response_format={ "type": "json_object" }, cache_ingredients=None):
+    """
+    Stream the text of a completion. A cached response is yielded as one
+    piece. The parsed response is stored in the response cache once the stream
+    has finished and parses as JSON.
+    Args:
+        messages (list): Chat messages sent to the model
+        response_format (dict): Response format / JSON schema
+        cache_ingredients (list): Ingredient set the request is about
+    Yields:
+        str: Pieces of the JSON response text
+    """
+    cache_key = None
+    response_cache = get_response_cache() if cache_ingredients is not None else None
+    if response_cache is not None:
+        cache_key = make_cache_key(cache_ingredients, KOLANK_MODEL, response_format, KOLANK_TEMPERATURE)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Kolank response served from cache")
+            yield json.dumps(cached)
+            return
+
+    pieces = []
+    started = time.perf_counter()
+    try:
+        stream = get_client().chat.completions.create(
+            model=KOLANK_MODEL,
+            messages=messages,
+            max_tokens=KOLANK_MAX_TOKENS,
+            temperature=KOLANK_TEMPERATURE,
+            response_format=response_format,
+            stream=True
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not pieces:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_token")
+                pieces.append(delta)
+                yield delta
+        STAGE_SECONDS.observe(time.perf_counter() - started, "llm_stream")
+    except Exception as e:
+        logger.error("Error streaming from Kolank API: %s", e)
+        return
+
+    if cache_key is not None:
+        try:
+            response_cache.set(cache_key, json.loads("".join(pieces)))
+        except json.JSONDecodeError as e:
+            logger.error("JSON decode error: %s", e)
+
+class AsyncRateLimiter:
+    """
+    Token bucket allowing `per_minute` units per minute, refilled
+    continuously. Used for both request and token budgets.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(per_minute, 1.0)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1.0):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+def _estimate_tokens(messages):
+    # Rough token count (about 4 characters per token) plus the completion budget
+    return sum(len(m.get("content", "")) for m in messages) / 4 + KOLANK_MAX_TOKENS
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _retry_delay(error, attempt):
+    # Honour Retry-After when the server sends it, otherwise exponential backoff with jitter
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+async def _complete(client, messages, response_format, semaphore, request_limiter, token_limiter,
+                    max_retries):
+    for attempt in range(max_retries + 1):
+        await request_limiter.acquire()
+        await token_limiter.acquire(_estimate_tokens(messages))
+        try:
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    model=KOLANK_MODEL,
+                    messages=messages,
+                    max_tokens=KOLANK_MAX_TOKENS,
+                    temperature=KOLANK_TEMPERATURE,
+                    response_format=response_format
+                )
+            return json.loads(response.choices[0].message.content)
+        except json.JSONDecodeError as e:
+            logger.error("JSON decode error: %s", e)
+            return None
+        except Exception as e:
+            if attempt < max_retries and _is_retryable(e):
+                delay = _retry_delay(e, attempt)
+                logger.warning("Kolank request failed (%s); retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                continue
+            logger.error("Error calling Kolank API: %s", e)
+            return None
+
+async def acall_kolank_api_batch(messages_list, response_format={ "type": "json_object" },
+                                 concurrency=LLM_CONCURRENCY,
+                                 requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                                 tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                                 max_retries=LLM_MAX_RETRIES):
+    """
+    Run many chat completions concurrently.
+    Args:
+        messages_list (list): One list of chat messages per request
+        response_format (dict): Response format / JSON schema for every request
+        concurrency (int): Maximum number of requests in flight
+        requests_per_minute (float): Request rate limit
+        tokens_per_minute (float): Estimated token rate limit
+        max_retries (int): Retries per request on 429, 5xx and connection errors
+    Returns:
+        list: Parsed JSON responses (None for failed requests), in input order
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    request_limiter = AsyncRateLimiter(requests_per_minute)
+    token_limiter = AsyncRateLimiter(tokens_per_minute)
+    # One client (and connection pool) for the whole batch; retries are handled here
+    async with AsyncOpenAI(base_url=KOLANK_URL, api_key=KOLANK_API_KEY, max_retries=0) as client:
+        return await asyncio.gather(*(
+            _complete(client, messages, response_format, semaphore, request_limiter,
+                      token_limiter, max_retries)
+            for messages in messages_list
+        ))
+
+def call_kolank_api_batch(messages_list, response_format={ "type": "json_object" }, **limits):
+    # Synchronous wrapper around acall_kolank_api_batch
+    return asyncio.run(acall_kolank_api_batch(messages_list, response_format, **limits))
+
 # Function for calling OpenAI API directly
 def call_openai_api(messages, response_format={ "type": "json_object" }, max_tokens=1024, temperature=0.2):
     try:
@@ -64,12 +282,12 @@ def call_openai_api(messages, response_format={ "type": "json_object" }, max_tok
 
         # Extract the message content from the response
         json_response = response.choices[0].message.content
-        logger.debug(f"OpenAI Model response: {json_response}")
+        logger.debug("OpenAI Model response: %s", json_response)
 
         # Parse the JSON response
         data = json.loads(json_response)
     except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error: {e}")
+        logger.error("JSON decode error: %s", e)
         data = None
     
 
@@ -0,0 +1,304 @@
+# near_duplicates.py
+
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from ingredient_parser import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# MinHash signature length and LSH banding. With 16 bands of 4 rows, recipes whose
+# feature sets have a Jaccard similarity of 0.7 become candidates ~99% of the time.
+NUM_PERM = int(os.getenv("NEAR_DUP_PERMUTATIONS", "64"))
+BANDS = int(os.getenv("NEAR_DUP_BANDS", "16"))
+
+# Minimum estimated similarity for two recipes to count as near-duplicates
+THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))
+
+# Recipes added since the last rebuild of the sorted band arrays before they are rebuilt
+COMPACT_MIN = 10000
+
+# Buckets shared by more recipes than this (e.g. only staples like salt and butter
+# agree) say little about similarity and are skipped at lookup time
+MAX_BUCKET = 256
+
+_WORD = re.compile(r"[a-z0-9]+")
+_TITLE_STOPWORDS = frozenset({"a", "an", "and", "the", "with", "of", "in", "on", "for", "or", "to", "n"})
+
+def recipe_features(title, ingredient_names):
+    """
+    Shingles compared between recipes: the canonical ingredient names plus
+    the title's words and word pairs.
+    Args:
+        title (str): Recipe title
+        ingredient_names (iterable): Names of the recipe's ingredients
+    Returns:
+        set: Feature strings
+    """
+    features = {f"i:{normalize_name(name)}" for name in ingredient_names if name and str(name).strip()}
+    words = [word for word in _WORD.findall(str(title or "").casefold()) if word not in _TITLE_STOPWORDS]
+    features.update(f"t:{word}" for word in words)
+    features.update(f"t:{first} {second}" for first, second in zip(words, words[1:]))
+    return features
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over recipes. Each recipe's feature set is reduced to
+    a MinHash signature whose bands are hashed into buckets; recipes that
+    share a bucket are candidates, and candidates whose signatures agree on
+    at least `threshold` of their positions are near-duplicates.
+
+    Band keys of the bulk of the index live in sorted numpy arrays (one
+    binary search per band); recipes added since then sit in a small dict
+    until the arrays are rebuilt.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, threshold=THRESHOLD, seed=1):
+        """
+        Args:
+            num_perm (int): Signature length; must be a multiple of bands
+            bands (int): Number of LSH bands
+            threshold (float): Minimum estimated Jaccard similarity of a near-duplicate
+            seed (int): Seed of the hash permutations
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions: odd 64-bit multipliers, upper 32 bits of a * x + b
+        self._a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 1 << 63, self.rows, dtype=np.uint64) | np.uint64(1)
+
+        self._ids = {}              # title -> recipe id
+        self._titles = []           # recipe id -> title
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._sorted_keys = [np.empty(0, dtype=np.uint64)] * bands
+        self._sorted_ids = [np.empty(0, dtype=np.int64)] * bands
+        self._recent = {}           # (band, key) -> recipe ids added since the last rebuild
+        self._recent_count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._titles)
+
+    def _signature_batch(self, feature_sets):
+        # MinHash signatures of non-empty feature sets, one row per set
+        counts = np.fromiter((len(features) for features in feature_sets), np.int64, len(feature_sets))
+        hashes = np.fromiter((zlib.crc32(feature.encode("utf-8"))
+                              for features in feature_sets for feature in features),
+                             np.uint64, int(counts.sum()))
+        # uint64 arithmetic wraps modulo 2**64, as multiply-shift hashing expects
+        permuted = ((hashes[:, None] * self._a + self._b) >> np.uint64(32)).astype(np.uint32)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return np.minimum.reduceat(permuted, offsets, axis=0)
+
+    def _band_keys(self, signatures):
+        # One 64-bit key per band; uint64 arithmetic wraps, which is fine for hashing
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (banded * self._band_mix).sum(axis=2, dtype=np.uint64)
+
+    def add_many(self, records, batch_size=5000, bulk=False):
+        """
+        Add or replace recipes.
+        Args:
+            records (iterable): (title, ingredient names) pairs, e.g.
+                knowledge_graph.iter_recipe_ingredient_sets()
+            batch_size (int): Recipes hashed per numpy batch
+            bulk (bool): Index the band keys once at the end instead of per
+                batch; the new recipes are not found by lookups until then
+        Returns:
+            int: Number of recipes added or replaced
+        """
+        added = 0
+        batch = []
+        for title, names in records:
+            features = recipe_features(title, names)
+            if title and features:
+                batch.append((title, features))
+            if len(batch) >= batch_size:
+                added += self._add_batch(batch, index_keys=not bulk)
+                batch = []
+        if batch:
+            added += self._add_batch(batch, index_keys=not bulk)
+        if bulk:
+            with self._lock:
+                self._compact()
+        return added
+
+    def add(self, title, ingredient_names):
+        return self.add_many([(title, ingredient_names)]) == 1
+
+    def add_rows(self, rows):
+        # Write listener for knowledge_graph: rows of {'title', 'ingredients', 'directions'}
+        self.add_many((row["title"], [ing["ingredient"] for ing in row["ingredients"]]) for row in rows)
+
+    def _add_batch(self, batch, index_keys=True):
+        signatures = self._signature_batch([features for _, features in batch])
+        keys = self._band_keys(signatures)
+        with self._lock:
+            new_rows = []
+            recipe_ids = []
+            for title, _ in batch:
+                recipe_id = self._ids.get(title)
+                if recipe_id is None:
+                    recipe_id = self._ids[title] = len(self._titles) + len(new_rows)
+                    new_rows.append(title)
+                recipe_ids.append(recipe_id)
+            self._titles.extend(new_rows)
+            if len(self._titles) > len(self._signatures):
+                grown = np.empty((max(len(self._titles), 2 * len(self._signatures)), self.num_perm), dtype=np.uint32)
+                grown[:len(self._signatures)] = self._signatures
+                self._signatures = grown
+            # A replaced recipe keeps its old band keys until the next rebuild; those only
+            # produce extra candidates, which the signature comparison then rejects
+            self._signatures[recipe_ids] = signatures
+            if not index_keys:
+                return len(batch)
+            for recipe_id, row_keys in zip(recipe_ids, keys.tolist()):
+                for band, key in enumerate(row_keys):
+                    self._recent.setdefault((band, key), []).append(recipe_id)
+            self._recent_count += len(batch)
+            if self._recent_count >= max(COMPACT_MIN, len(self._titles) // 10):
+                self._compact()
+        return len(batch)
+
+    def _compact(self):
+        # Rebuild the sorted band arrays from every signature (called with the lock held)
+        keys = self._band_keys(self._signatures[:len(self._titles)])
+        for band in range(self.bands):
+            order = np.argsort(keys[:, band], kind="stable")
+            self._sorted_keys[band] = keys[order, band]
+            self._sorted_ids[band] = order
+        self._recent = {}
+        self._recent_count = 0
+
+    def query(self, title, ingredient_names, threshold=None):
+        """
+        Stored recipes similar to a recipe, other than one with the same title.
+        Args:
+            title (str): Recipe title
+            ingredient_names (iterable): Names of the recipe's ingredients
+            threshold (float): Minimum estimated similarity; defaults to the index's
+        Returns:
+            list: (title, estimated similarity) tuples, most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        features = recipe_features(title, ingredient_names)
+        if not features:
+            return []
+        signature = self._signature_batch([features])
+        keys = self._band_keys(signature)[0]
+        with self._lock:
+            buckets = []
+            for band in range(self.bands):
+                # Search with the numpy uint64 itself; a Python int above 2**63 would make
+                # searchsorted convert the whole array
+                key = keys[band:band + 1]
+                sorted_keys = self._sorted_keys[band]
+                start = int(sorted_keys.searchsorted(key, side="left")[0])
+                end = int(sorted_keys.searchsorted(key, side="right")[0])
+                if end - start <= MAX_BUCKET:
+                    buckets.append(self._sorted_ids[band][start:end])
+                recent = self._recent.get((band, int(key[0])))
+                if recent:
+                    buckets.append(np.asarray(recent, dtype=np.int64))
+            if not buckets:
+                return []
+            candidate_ids = np.unique(np.concatenate(buckets))
+            own_id = self._ids.get(title)
+            if own_id is not None:
+                candidate_ids = candidate_ids[candidate_ids != own_id]
+            similarity = (self._signatures[candidate_ids] == signature).mean(axis=1)
+            matches = [(self._titles[recipe_id], float(score))
+                       for recipe_id, score in zip(candidate_ids.tolist(), similarity.tolist())
+                       if score >= threshold]
+        return sorted(matches, key=lambda match: -match[1])
+
+    def find(self, title, ingredient_names, threshold=None):
+        """
+        Returns:
+            tuple: (title, estimated similarity) of the most similar stored
+            recipe at or above the threshold, or None
+        """
+        matches = self.query(title, ingredient_names, threshold)
+        return matches[0] if matches else None
+
+    def filter_rows(self, rows):
+        """
+        Drop recipe rows that are near-duplicates of an indexed recipe or of
+        an earlier row, indexing the rows that are kept. Used to merge
+        near-duplicates at ingest time.
+        Args:
+            rows (iterable): Dicts with 'title' and 'ingredients' (list of {'quantity', 'ingredient'})
+        Yields:
+            dict: Rows that are not near-duplicates
+        """
+        skipped = 0
+        for row in rows:
+            names = [ing["ingredient"] for ing in row["ingredients"]]
+            match = self.find(row["title"], names)
+            if match is not None:
+                skipped += 1
+                logger.debug("Skipping '%s', a near-duplicate of '%s' (%.2f)", row["title"], *match)
+                continue
+            self.add(row["title"], names)
+            yield row
+        logger.info("Skipped %d near-duplicate recipes", skipped)
+
+    @classmethod
+    def from_records(cls, records, **kwargs):
+        """
+        Build an index from (title, ingredient names) pairs, e.g.
+        knowledge_graph.iter_recipe_ingredient_sets() or recommender.recipe_sets_from_csv().
+        """
+        index = cls(**kwargs)
+        started = time.perf_counter()
+        index.add_many(records, bulk=True)
+        logger.info("Near-duplicate index built with %d recipes in %.1fs", len(index), time.perf_counter() - started)
+        return index
+
+    def stats(self):
+        with self._lock:
+            return {"recipes": len(self._titles), "recent": self._recent_count}
+
+def benchmark(path, queries=1000, seed=0):
+    """
+    Build the index from a recipe CSV and time lookups of stored recipes
+    whose titles have been changed slightly.
+    """
+    from recommender import recipe_sets_from_csv
+
+    records = [(title, names) for title, names in recipe_sets_from_csv(path) if isinstance(title, str)]
+    index = NearDuplicateIndex.from_records(records)
+    rng = np.random.default_rng(seed)
+    latencies = []
+    found = 0
+    for position in rng.integers(0, len(records), queries):
+        title, names = records[position]
+        started = time.perf_counter()
+        match = index.find(f"{title} Casserole", names)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found += match is not None and match[0] == title
+    p50, p99 = np.percentile(latencies, [50, 99])
+    logger.info("Lookup p50 %.3f ms, p99 %.3f ms; %d/%d renamed recipes matched", p50, p99, found, queries)
+    return {"p50_ms": float(p50), "p99_ms": float(p99), "recall": found / queries}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate recipe lookups")
+    parser.add_argument("--path", default="receipes.csv", help="Recipe CSV to index")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    benchmark(args.path, args.queries)
@@ -0,0 +1,127 @@
+# partial_json.py
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\r\n"
+
+class PartialJSONParser:
+    """
+    Incremental parser for a JSON document that arrives in pieces, e.g.
+    streamed model output. feed() scans only the new text; value() closes
+    whatever is still open (strings, arrays, objects) and drops a trailing
+    key or literal that is not complete yet, so the fields seen so far can
+    be rendered before the document ends.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        self._stack = []            # open containers: '{' or '['
+        self._expect_key = False    # inside an object, before a key
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._token_start = None    # start of the string or literal being read
+        self._pending_key = None    # start of a finished key still waiting for its ':'
+        self._text = ""
+        self._dirty = False
+
+    @property
+    def text(self):
+        if self._dirty:
+            self._text = "".join(self._chunks)
+            self._chunks = [self._text]
+            self._dirty = False
+        return self._text
+
+    def feed(self, delta):
+        offset = self._length
+        for i, char in enumerate(delta):
+            position = offset + i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._pending_key = self._token_start
+                    self._token_start = None
+                continue
+            if char == ":":
+                self._pending_key = None
+            if self._token_start is not None and (char in _WHITESPACE or char in ",:]}"):
+                self._token_start = None    # literal or number finished
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = bool(self._stack) and self._stack[-1] == "{" and self._expect_key
+                self._token_start = position
+                self._expect_key = False
+            elif char in "{[":
+                self._stack.append(char)
+                self._expect_key = char == "{"
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self._expect_key = False
+            elif char == ",":
+                self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+            elif char not in _WHITESPACE and char != ":" and self._token_start is None:
+                self._token_start = position
+        self._chunks.append(delta)
+        self._length += len(delta)
+        self._dirty = True
+
+    @property
+    def complete(self):
+        # True once the top-level value has been closed
+        return not self._stack and not self._in_string and bool(self.text.strip())
+
+    def value(self):
+        """
+        Returns:
+            The document parsed so far (usually a dict), or None if nothing
+            usable has arrived yet
+        """
+        text = self.text
+        if not self._stack:
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError:
+                return None
+
+        if self._in_string and not self._string_is_key:
+            partial = text[self._token_start:]
+            if self._escape:
+                partial = partial[:-1]
+            # Drop an unfinished \uXXXX escape
+            cut = partial.rfind("\\u")
+            if cut != -1 and len(partial) - cut < 6 and (cut == 0 or partial[cut - 1] != "\\"):
+                partial = partial[:cut]
+            text = text[:self._token_start] + partial + '"'
+        elif self._token_start is not None:
+            text = text[:self._token_start]
+        elif self._pending_key is not None:
+            text = text[:self._pending_key]
+
+        text = text.rstrip(_WHITESPACE)
+        while text.endswith(","):
+            text = text[:-1].rstrip(_WHITESPACE)
+        if text.endswith(":"):
+            text += "null"
+        text += "".join("}" if container == "{" else "]" for container in reversed(self._stack))
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.debug("Partial JSON not parseable yet: %s", e)
+            return None
+
+def parse_partial_json(text):
+    # One-shot helper: best-effort parse of a possibly truncated JSON document
+    parser = PartialJSONParser()
+    parser.feed(text)
+    return parser.value()
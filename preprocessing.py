@@ -1,80 +1,442 @@
 # preprocessing.py
 
 import pandas as pd
+import argparse
+import csv
+import hashlib
 import logging
-from data_processing import parse_ingredient
-from knowledge_graph import create_knowledge_graph
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from data_processing import parse_ingredient, parse_json_list
+from ingredient_parser import clean_name
+from knowledge_graph import (bulk_load_recipes, ensure_schema, iter_recipe_ingredient_sets,
+                             explain_queries, BULK_BATCH_SIZE)
+from near_duplicates import NearDuplicateIndex
+from ingest_manifest import IngestManifest, MANIFEST_PATH, recipe_hash
 from dotenv import load_dotenv
 import os
 
 # Initialize logger
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 # Path to your CSV file
-data_path = 'receipes.csv'
+data_path = os.getenv("RECIPE_CSV_PATH", 'receipes.csv')
 
-# Function to parse ingredients list from a string representation
-def parse_ingredients_list(ingredients_str):
+# Number of CSV rows read per chunk in streaming mode
+CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "10000"))
+
+# Number of worker processes used by the parallel parsing stage
+PARSE_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+
+# Array delimiter used for list properties in the neo4j-admin import files
+ADMIN_ARRAY_DELIMITER = "\x1f"
+
+# Columns of the recipe CSV used to build the knowledge graph
+RECIPE_COLUMNS = ['title', 'ingredients', 'directions', 'NER']
+
+# Function to parse ingredients list from a JSON array string, with the
+# recipe's NER names as canonicalization hints
+def parse_ingredients_list(ingredients_str, hints=()):
+    try:
+        return [parse_ingredient(ingredient, hints) for ingredient in parse_json_list(ingredients_str)]
+    except ValueError as e:
+        logger.error("Error parsing ingredients: %s", e)
+        return []
+
+# Function to parse the directions column from a JSON array string
+def parse_directions_list(directions_str):
+    try:
+        return parse_json_list(directions_str)
+    except ValueError as e:
+        logger.error("Error parsing directions: %s", e)
+        return []
+
+# Function to parse the NER column (clean ingredient names) from a JSON array string
+def parse_ner_list(ner_str):
     try:
-        ingredients_list = eval(ingredients_str)
-        # print(':::::::::::::::::::::::::::::::::::::::::::',ingredients_list)
-        return [parse_ingredient(ingredient) for ingredient in ingredients_list]
-    except Exception as e:
-        logger.error(f"Error parsing ingredients: {e}")
+        return parse_json_list(ner_str)
+    except ValueError as e:
+        logger.error("Error parsing NER: %s", e)
         return []
 
+def iter_csv_chunks(path=data_path, chunksize=CHUNK_SIZE, skip_rows=0):
+    """
+    Read the recipe CSV in fixed-size chunks so only one chunk is in memory.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        chunksize (int): Number of rows per chunk
+        skip_rows (int): Number of data rows to skip at the start of the file
+    Yields:
+        DataFrame: The next chunk of raw rows
+    """
+    yield from pd.read_csv(
+        path,
+        usecols=RECIPE_COLUMNS,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunksize,
+        skiprows=range(1, skip_rows + 1) if skip_rows else None,
+    )
+
+def parse_recipe_row(title, ingredients, directions, ner):
+    # Turn one raw CSV row into the recipe record consumed by the graph writer
+    ner_names = parse_ner_list(ner)
+    return {
+        "title": title,
+        "ingredients": parse_ingredients_list(ingredients, ner_names),
+        "directions": parse_directions_list(directions),
+        "ner": ner_names,
+    }
+
+def iter_recipe_records(path=data_path, chunksize=CHUNK_SIZE):
+    """
+    Stream parsed recipe records from the CSV one at a time.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        chunksize (int): Number of rows read from disk per chunk
+    Yields:
+        dict: Recipe with 'title', 'ingredients', 'directions' and 'ner'
+    """
+    for chunk in iter_csv_chunks(path, chunksize):
+        for row in zip(*(chunk[column] for column in RECIPE_COLUMNS)):
+            yield parse_recipe_row(*row)
+
+def parse_chunk(rows):
+    # Parse a list of raw (title, ingredients, directions, NER) tuples; runs in a worker process
+    return [parse_recipe_row(*row) for row in rows]
+
+def _parse_in_order(batches, workers):
+    # Parse (key, raw rows) batches across a process pool with at most two batches per
+    # worker in flight, yielding (key, records) in input order; workers <= 1 parses in-process
+    if workers <= 1:
+        for key, rows in batches:
+            yield key, parse_chunk(rows)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for key, rows in batches:
+            pending.append((key, pool.submit(parse_chunk, rows)))
+            if len(pending) >= workers * 2:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+
+def iter_recipe_records_parallel(path=data_path, chunksize=CHUNK_SIZE, workers=PARSE_WORKERS):
+    """
+    Stream parsed recipe records, parsing CSV chunks across a process pool.
+    At most two chunks per worker are in flight, so memory stays bounded,
+    and records are yielded in the same order as the input file.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        chunksize (int): Number of rows per chunk sent to a worker
+        workers (int): Number of worker processes; 1 parses in-process
+    Yields:
+        dict: Recipe with 'title', 'ingredients', 'directions' and 'ner'
+    """
+    if workers <= 1:
+        yield from iter_recipe_records(path, chunksize)
+        return
+
+    batches = ((None, list(zip(*(chunk[column] for column in RECIPE_COLUMNS))))
+               for chunk in iter_csv_chunks(path, chunksize))
+    for _, records in _parse_in_order(batches, workers):
+        yield from records
+
+def benchmark_parsing(path=data_path, max_workers=PARSE_WORKERS, chunksize=CHUNK_SIZE):
+    """
+    Measure parsing throughput for 1..max_workers worker processes.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        max_workers (int): Largest worker count to measure
+        chunksize (int): Number of rows per chunk sent to a worker
+    Returns:
+        dict: Rows per second keyed by worker count
+    """
+    results = {}
+    for workers in range(1, max_workers + 1):
+        started = time.perf_counter()
+        rows = sum(1 for _ in iter_recipe_records_parallel(path, chunksize, workers))
+        elapsed = time.perf_counter() - started
+        results[workers] = rows / elapsed if elapsed else 0.0
+        logger.info("Parsing benchmark: %d worker(s), %d rows in %.2fs "
+                    "(%.0f rows/s)", workers, rows, elapsed, results[workers])
+    return results
+
+def stream_load_data(path=data_path, chunksize=CHUNK_SIZE, batch_size=BULK_BATCH_SIZE,
+                     workers=PARSE_WORKERS, dedupe_index=None):
+    """
+    Load the CSV into the knowledge graph without holding it in memory.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        chunksize (int): Number of rows read from disk per chunk
+        batch_size (int): Number of recipes written per transaction
+        workers (int): Number of parsing worker processes
+        dedupe_index (NearDuplicateIndex): If given, rows that nearly duplicate
+            a stored recipe or an earlier row are skipped
+    Returns:
+        int: Number of recipes written
+    """
+    records = iter_recipe_records_parallel(path, chunksize, workers)
+    if dedupe_index is not None:
+        records = dedupe_index.filter_rows(records)
+    return bulk_load_recipes(records, batch_size=batch_size)
+
+def _new_rows_by_chunk(manifest, path, chunksize, rows_done):
+    # ((new rows keyed by hash, rows done after the chunk), new raw rows) for every chunk after
+    # the checkpoint. A row repeated in a later chunk before this one is recorded is parsed
+    # again, which rewrites the same recipe.
+    for chunk in iter_csv_chunks(path, chunksize, skip_rows=rows_done):
+        rows = list(zip(*(chunk[column] for column in RECIPE_COLUMNS)))
+        hashes = [recipe_hash(title, ingredients, directions)
+                  for title, ingredients, directions, _ in rows]
+        unseen = manifest.unseen(hashes)
+        new_rows = {}
+        for row_hash, row in zip(hashes, rows):
+            if row_hash in unseen:
+                new_rows.setdefault(row_hash, row)
+        rows_done += len(rows)
+        yield (new_rows, rows_done), list(new_rows.values())
+
+def incremental_load_data(path=data_path, chunksize=CHUNK_SIZE, batch_size=BULK_BATCH_SIZE,
+                          manifest_path=MANIFEST_PATH, dedupe_index=None, workers=PARSE_WORKERS):
+    """
+    Write only new or changed recipe rows to the knowledge graph, resuming
+    from the last checkpoint if a previous run was interrupted.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        chunksize (int): Number of rows read from disk per chunk
+        batch_size (int): Number of recipes written per transaction
+        manifest_path (str): SQLite file holding row hashes and checkpoints
+        dedupe_index (NearDuplicateIndex): If given, rows that nearly duplicate
+            a stored recipe or an earlier row are skipped
+        workers (int): Number of worker processes parsing new rows
+    Returns:
+        int: Number of recipes written
+    """
+    manifest = IngestManifest(manifest_path)
+    try:
+        if manifest.is_complete(path):
+            logger.info("%s is unchanged since the last ingest; nothing to do", path)
+            return 0
+
+        rows_done = manifest.checkpoint(path)
+        if rows_done:
+            logger.info("Resuming ingest of %s after row %d", path, rows_done)
+
+        written = 0
+        chunks = _new_rows_by_chunk(manifest, path, chunksize, rows_done)
+        for (new_rows, rows_done), records in _parse_in_order(chunks, workers):
+            if records:
+                if dedupe_index is not None:
+                    records = dedupe_index.filter_rows(records)
+                written += bulk_load_recipes(records, batch_size=batch_size)
+            # Only record hashes once the graph writes for the chunk have committed
+            manifest.record(new_rows.keys(), source=path, rows_done=rows_done)
+
+        manifest.mark_complete(path, rows_done)
+        logger.info("Incremental ingest of %s: %d new or changed recipes written", path, written)
+        return written
+    finally:
+        manifest.close()
+
 # Function to add a new ingredient to the knowledge graph if it doesn't exist
-def add_new_ingredient(ingredient_name, all_ingredients):
+def add_new_ingredient(ingredient_name, registry):
     """
-    Add a new ingredient to the knowledge graph and ingredient list
+    Add a new ingredient to the ingredient registry under its canonical
+    name, so "Evaporated Milk" typed into the search box matches the
+    "evaporated milk" node loaded from the CSV. Its node is written to the
+    knowledge graph in the background by the registry.
     Args:
         ingredient_name (str): Name of the ingredient to add
-        all_ingredients (list): Current list of all ingredients
+        registry (IngredientRegistry): Registry of all known ingredients
+    Returns:
+        bool: True if the ingredient was new
+    """
+    ingredient_name = clean_name(ingredient_name or "")
+    added = registry.add(ingredient_name)
+    if added:
+        logger.info("Added new ingredient: %s", ingredient_name)
+    return added
+
+def load_and_preprocess_data(path=data_path, batch_size=BULK_BATCH_SIZE, manifest_path=MANIFEST_PATH,
+                             workers=PARSE_WORKERS):
+    """
+    Bring the knowledge graph up to date with the CSV. An unchanged file
+    (same size and modification time as the last complete load) is skipped
+    without being read; otherwise raw rows are hashed chunk by chunk and
+    only rows not in the manifest are parsed and written.
+    Args:
+        path (str): Path to a CSV in the receipes.csv format
+        batch_size (int): Number of recipes written per transaction
+        manifest_path (str): SQLite file holding row hashes and checkpoints
+        workers (int): Number of worker processes parsing new rows
     Returns:
-        list: Updated list of ingredients
-    """
-    # print("inside add_new_ingredient before if")
-    print(all_ingredients,":::",ingredient_name)
-    if isinstance(all_ingredients, list) and ingredient_name not in all_ingredients:
-        # Create ingredient node in knowledge graph
-        print("inside add_new_ingredient")
-        create_knowledge_graph(ingredient_name, [], [])
-        # Add to list and sort
-        all_ingredients.append(ingredient_name)
-        all_ingredients.sort()
-        logger.info(f"Added new ingredient: {ingredient_name}")
-    return all_ingredients
-
-def load_and_preprocess_data():
-    # Load the CSV file
-    df = pd.read_csv(data_path)
-
-    # Parse ingredients and add parsed ingredients column
-    df['parsed_ingredients'] = df['ingredients'].apply(parse_ingredients_list)
-    # print('::::::::::::::::::::::::::----------------------:::::::::::::::::',df['parsed_ingredients'])
-    # Extract individual ingredients from the parsed ingredients
-    all_ingredients = set()
-    for ingredients in df['parsed_ingredients']:
-        for ingredient in ingredients:
-            all_ingredients.add(ingredient['ingredient'])
-
-    # Convert set to list and sort
-    all_ingredients = sorted(list(all_ingredients))
-    
-    # Update the knowledge graph with all ingredients
-    for ingredient in all_ingredients:
-        print("inside for loop",ingredient,all_ingredients)
-        add_new_ingredient(ingredient, all_ingredients)
-    
-    return df, all_ingredients
+        int: Number of recipes written
+    """
+    return incremental_load_data(path, batch_size=batch_size, manifest_path=manifest_path,
+                                 workers=workers)
+
+def _stable_id(*parts):
+    # Deterministic 64-bit id derived from a node's merge key
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+def _last_rows_by_title(path=data_path, chunksize=CHUNK_SIZE):
+    # Boolean mask over CSV rows that is True for the last row of each title, read from the
+    # title column only. Titles are held as 64-bit ids in one NumPy array, so peak memory is
+    # about 40 bytes per row (the ids plus np.unique's sort) instead of a dict entry per title.
+    ids = []
+    titled = []
+    for chunk in pd.read_csv(path, usecols=['title'], dtype=str, keep_default_na=False, chunksize=chunksize):
+        titles = chunk['title'].to_numpy()
+        ids.append(np.fromiter((_stable_id(title) if title else 0 for title in titles),
+                               dtype=np.uint64, count=len(titles)))
+        titled.append(titles != "")
+    if not ids:
+        return np.zeros(0, dtype=bool)
+    ids = np.concatenate(ids)
+    # np.unique reports the first occurrence of each id, so it is run on the reversed ids
+    _, from_end = np.unique(ids[::-1], return_index=True)
+    is_last = np.zeros(len(ids), dtype=bool)
+    is_last[len(ids) - 1 - from_end] = True
+    return is_last & np.concatenate(titled)
+
+def export_admin_import_csv(out_dir, path=data_path, chunksize=CHUNK_SIZE, workers=PARSE_WORKERS):
+    """
+    Convert the recipe CSV into node and relationship files for
+    `neo4j-admin database import`, following the same model as
+    knowledge_graph.create_knowledge_graph. Products are keyed by title and
+    ingredients by name. When several rows share a title, the last one is
+    exported, matching a Bolt load where each later row replaces the
+    recipe written by the earlier ones.
+    Args:
+        out_dir (str): Directory the import files are written to
+        path (str): Path to a CSV in the receipes.csv format
+        chunksize (int): Number of rows read from disk per chunk
+        workers (int): Number of parsing worker processes
+    Returns:
+        str: The neo4j-admin command that imports the generated files
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = {
+        "products": ["productId:ID(Product)", "title", "directions:string[]"],
+        "ingredients": ["ingredientId:ID(Ingredient)", "name"],
+        "directions": ["directionId:ID(Direction)", "order:int", "description"],
+        "used_in": [":START_ID(Ingredient)", ":END_ID(Product)", "quantity"],
+        "has_step": [":START_ID(Product)", ":END_ID(Direction)", "order:int"],
+    }
+    paths = {name: os.path.join(out_dir, f"{name}.csv") for name in files}
+    handles = {name: open(paths[name], "w", newline="", encoding="utf-8") for name in files}
+    try:
+        writers = {name: csv.writer(handle) for name, handle in handles.items()}
+        for name, header in files.items():
+            writers[name].writerow(header)
+
+        # Only a per-row mask is kept for de-duplication, never the rows themselves
+        is_last = _last_rows_by_title(path, chunksize)
+        seen_ingredients = set()
+        recipes = 0
+        for row, recipe in enumerate(iter_recipe_records_parallel(path, chunksize, workers)):
+            title = recipe["title"]
+            if not title or not is_last[row]:
+                continue
+            product_id = _stable_id(title)
+            recipes += 1
+            writers["products"].writerow(
+                [product_id, title, ADMIN_ARRAY_DELIMITER.join(recipe["directions"])])
+
+            used_in = set()
+            for ingredient in recipe["ingredients"]:
+                name = ingredient["ingredient"]
+                if not name:
+                    continue
+                ingredient_id = _stable_id(name)
+                if ingredient_id not in seen_ingredients:
+                    seen_ingredients.add(ingredient_id)
+                    writers["ingredients"].writerow([ingredient_id, name])
+                edge = (ingredient_id, ingredient["quantity"])
+                if edge not in used_in:
+                    used_in.add(edge)
+                    writers["used_in"].writerow([ingredient_id, product_id, ingredient["quantity"]])
+
+            for order, step in enumerate(recipe["directions"], start=1):
+                direction_id = f"{product_id}-{order}"
+                writers["directions"].writerow([direction_id, order, step])
+                writers["has_step"].writerow([product_id, direction_id, order])
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    logger.info("Exported %d products and %d ingredients to %s", recipes, len(seen_ingredients), out_dir)
+    return (
+        "neo4j-admin database import full neo4j "
+        "--array-delimiter=U+001F "
+        f"--nodes=Product={paths['products']} "
+        f"--nodes=Ingredient={paths['ingredients']} "
+        f"--nodes=Direction={paths['directions']} "
+        f"--relationships=USED_IN={paths['used_in']} "
+        f"--relationships=HAS_STEP={paths['has_step']}"
+    )
 
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the recipe CSV into the knowledge graph")
+    parser.add_argument("--path", default=data_path, help="Recipe CSV to load")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write every row, without checking or updating the incremental manifest")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="Parsing worker processes (every load mode and --export-dir)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Stream the CSV and write only rows not recorded in the manifest")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="Incremental ingest manifest")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="With --stream or --incremental, skip rows that nearly duplicate a stored "
+                             "recipe or an earlier row")
+    parser.add_argument("--export-dir",
+                        help="Write neo4j-admin import CSVs to this directory instead of loading over Bolt")
+    parser.add_argument("--schema-report", action="store_true",
+                        help="Create constraints and indexes, report index seeks vs scans and exit")
+    parser.add_argument("--benchmark-parse", type=int, metavar="N",
+                        help="Report parsing rows/sec for 1..N workers and exit")
+    args = parser.parse_args()
+    if args.dedupe and not (args.stream or args.incremental):
+        parser.error("--dedupe requires --stream or --incremental")
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+    if args.schema_report:
+        ensure_schema()
+        explain_queries()
+        raise SystemExit(0)
+
+    if args.benchmark_parse:
+        benchmark_parsing(args.path, args.benchmark_parse, args.chunk_size)
+        raise SystemExit(0)
+
+    if args.export_dir:
+        command = export_admin_import_csv(args.export_dir, args.path, args.chunk_size, args.workers)
+        logger.info("Import with: %s", command)
+        raise SystemExit(0)
+
     logger.info("Starting data preprocessing...")
-    df, all_ingredients = load_and_preprocess_data()
+    dedupe_index = NearDuplicateIndex.from_records(iter_recipe_ingredient_sets()) if args.dedupe else None
+    if args.incremental:
+        incremental_load_data(args.path, chunksize=args.chunk_size, batch_size=args.batch_size,
+                              manifest_path=args.manifest, dedupe_index=dedupe_index, workers=args.workers)
+    elif args.stream:
+        stream_load_data(args.path, chunksize=args.chunk_size, batch_size=args.batch_size,
+                         workers=args.workers, dedupe_index=dedupe_index)
+    else:
+        load_and_preprocess_data(args.path, batch_size=args.batch_size, manifest_path=args.manifest,
+                                 workers=args.workers)
     logger.info("Data preprocessing completed.")
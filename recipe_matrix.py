@@ -0,0 +1,300 @@
+# recipe_matrix.py
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from recommender import recipe_sets_from_csv
+from ingredient_parser import normalize_name
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("coverage", "jaccard", "idf")
+
+# Ingredients found in at least this share of recipes also get a packed
+# bitset, which is smaller than their posting list and much faster to count
+BITSET_MIN_SHARE = 1 / 32
+
+# Number of score buckets used to pick top-k candidates
+SCORE_LEVELS = 1024
+
+# Files written by RecipeMatrix.save
+_ARRAYS = ("indptr", "indices", "recipe_sizes", "idf", "bitsets", "bitset_rows",
+           "titles_blob", "titles_offsets")
+
+def _pack_strings(strings):
+    # Concatenated UTF-8 blob plus offsets, so a string table can be memory-mapped
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+class RecipeMatrix:
+    """
+    Sparse recipe x ingredient incidence matrix with integer ingredient ids,
+    stored ingredient-major in CSR layout (indptr/indices; every stored
+    entry is 1). Frequent ingredients additionally get a packed bitset over
+    all recipes. Selections are scored against every recipe with vectorized
+    NumPy operations, and the arrays can be saved to a directory and
+    memory-mapped so several workers share one copy.
+    """
+
+    def __init__(self, indptr, indices, recipe_sizes, idf, bitsets, bitset_rows,
+                 titles_blob, titles_offsets, vocabulary):
+        self.indptr = indptr                  # ingredient id -> slice of indices
+        self.indices = indices                # recipe ids, sorted within each ingredient
+        self.recipe_sizes = recipe_sizes      # ingredient count per recipe
+        self.idf = idf                        # idf per ingredient id
+        self.bitsets = bitsets                # packed recipe bitsets of frequent ingredients
+        self.bitset_rows = bitset_rows        # ingredient id -> row in bitsets, or -1
+        self.titles_blob = titles_blob
+        self.titles_offsets = titles_offsets
+        self.names = list(vocabulary)
+        self.vocabulary = {name: i for i, name in enumerate(self.names)}
+        self._inverse_sizes = None
+        self._recipe_idf = None
+
+    @property
+    def n_recipes(self):
+        return len(self.recipe_sizes)
+
+    def title(self, recipe_id):
+        start, end = self.titles_offsets[recipe_id], self.titles_offsets[recipe_id + 1]
+        return bytes(self.titles_blob[start:end]).decode("utf-8")
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build the matrix from (title, ingredient names) pairs.
+        Args:
+            records (iterable): e.g. recommender.recipe_sets_from_csv(path)
+        Returns:
+            RecipeMatrix
+        """
+        vocabulary = {}
+        titles = []
+        indptr = [0]
+        indices = []
+        last_rows = {}
+        for title, names in records:
+            if not title:
+                continue
+            ids = {vocabulary.setdefault(normalize_name(name), len(vocabulary)) for name in names if name}
+            last_rows[title] = len(titles)
+            titles.append(title)
+            indices.extend(ids)
+            indptr.append(len(indices))
+
+        # A repeated title keeps only its last row, as in the graph, so top_k never returns
+        # a recipe twice; titles whose last row has no ingredients are left out
+        sizes = np.diff(indptr)
+        keep = np.fromiter(sorted(row for row in last_rows.values() if sizes[row]), dtype=np.int64)
+        titles = [titles[row] for row in keep]
+        n_recipes, n_ingredients = len(titles), len(vocabulary)
+        recipe_major = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.int8), np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, n_ingredients))[keep]
+        indices = recipe_major.indices
+        ingredient_major = recipe_major.T.tocsr()
+        ingredient_major.sort_indices()
+        col_indptr = ingredient_major.indptr.astype(np.int64)
+        col_indices = ingredient_major.indices.astype(np.int32)
+
+        document_freq = np.diff(col_indptr)
+        idf = (np.log((1 + n_recipes) / (1 + document_freq)) + 1).astype(np.float32)
+
+        frequent = np.flatnonzero(document_freq >= max(1, n_recipes * BITSET_MIN_SHARE))
+        bitset_rows = np.full(n_ingredients, -1, dtype=np.int32)
+        bitset_rows[frequent] = np.arange(len(frequent), dtype=np.int32)
+        bitsets = np.zeros((len(frequent), (n_recipes + 7) // 8), dtype=np.uint8)
+        for row, ingredient_id in enumerate(frequent):
+            members = np.zeros(n_recipes, dtype=bool)
+            members[col_indices[col_indptr[ingredient_id]:col_indptr[ingredient_id + 1]]] = True
+            bitsets[row] = np.packbits(members)
+
+        titles_blob, titles_offsets = _pack_strings(titles)
+        names = [None] * n_ingredients
+        for name, i in vocabulary.items():
+            names[i] = name
+        logger.info("Recipe matrix: %d recipes x %d ingredients, %d entries, %d bitsets",
+                    n_recipes, n_ingredients, len(indices), len(frequent))
+        return cls(col_indptr, col_indices, np.diff(recipe_major.indptr).astype(np.int32), idf,
+                   bitsets, bitset_rows, titles_blob, titles_offsets, names)
+
+    def encode(self, selection):
+        # Ingredient ids of a selection; unknown names are ignored
+        ids = {self.vocabulary.get(normalize_name(name)) for name in selection}
+        ids.discard(None)
+        return np.fromiter(sorted(ids), dtype=np.int64, count=len(ids))
+
+    def _postings(self, ingredient_id):
+        return self.indices[self.indptr[ingredient_id]:self.indptr[ingredient_id + 1]]
+
+    def _counts(self, ids):
+        # Dense per-recipe overlap counts. Frequent ingredients are added with
+        # bit-sliced counters over their bitsets, rare ones through posting lists.
+        dense = [i for i in ids if self.bitset_rows[i] >= 0]
+        planes = [np.zeros(self.bitsets.shape[1], dtype=np.uint8)
+                  for _ in range(max(1, len(dense).bit_length()))]
+        for i in dense:
+            carry = self.bitsets[self.bitset_rows[i]]
+            for plane in planes:
+                next_carry = plane & carry
+                plane ^= carry
+                carry = next_carry
+
+        dtype = np.uint8 if len(ids) < 256 else np.uint16
+        counts = np.zeros(self.n_recipes, dtype=dtype)
+        for bit, plane in enumerate(planes):
+            counts |= np.unpackbits(plane, count=self.n_recipes).astype(dtype) << bit
+        for i in ids:
+            if self.bitset_rows[i] < 0:
+                counts[self._postings(i)] += 1
+        return counts
+
+    def _matched_idf(self, ids):
+        matched = np.zeros(self.n_recipes, dtype=np.float32)
+        for i in ids:
+            row = self.bitset_rows[i]
+            if row >= 0:
+                matched += np.unpackbits(self.bitsets[row], count=self.n_recipes) * self.idf[i]
+            else:
+                matched[self._postings(i)] += self.idf[i]
+        return matched
+
+    def _dense_scores(self, ids, metric):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        if self._inverse_sizes is None:
+            self._inverse_sizes = (1.0 / np.maximum(self.recipe_sizes, 1)).astype(np.float32)
+        counts = self._counts(ids)
+        if metric == "coverage":
+            scores = counts * self._inverse_sizes
+        elif metric == "jaccard":
+            union = (len(ids) + self.recipe_sizes - counts).astype(np.float32)
+            scores = counts / union
+        else:
+            if self._recipe_idf is None:
+                weights = np.repeat(self.idf, np.diff(self.indptr))
+                self._recipe_idf = np.bincount(self.indices, weights=weights,
+                                               minlength=self.n_recipes).astype(np.float32)
+            scores = self._matched_idf(ids) / np.maximum(self._recipe_idf, 1e-6)
+        return scores.astype(np.float32, copy=False), counts
+
+    def score(self, selection, metric="coverage"):
+        """
+        Score every recipe sharing at least one ingredient with the selection.
+        Args:
+            selection (iterable): Ingredient names
+            metric (str): 'coverage' (share of the recipe's ingredients selected),
+                'jaccard', or 'idf' (idf-weighted coverage)
+        Returns:
+            tuple: (recipe ids, scores, overlap counts) as NumPy arrays
+        """
+        ids = self.encode(selection)
+        scores, counts = self._dense_scores(ids, metric)
+        recipes = np.flatnonzero(counts)
+        return recipes, scores[recipes], counts[recipes]
+
+    def top_k(self, selection, k=10, metric="coverage", min_score=0.0):
+        """
+        Returns:
+            list: (title, score, overlap count) tuples for the best k recipes
+        """
+        ids = self.encode(selection)
+        if len(ids) == 0 or self.n_recipes == 0:
+            return []
+        scores, counts = self._dense_scores(ids, metric)
+        # All metrics lie in [0, 1]. Bucket scores into SCORE_LEVELS levels and use the
+        # histogram to find the lowest level that still holds k recipes, so only
+        # that small candidate set is sorted. (argpartition degrades badly on the
+        # many tied scores these metrics produce.)
+        levels = (scores * SCORE_LEVELS).astype(np.int16)
+        above = np.cumsum(np.bincount(levels, minlength=SCORE_LEVELS + 1)[::-1])
+        cutoff = max(SCORE_LEVELS - int(np.searchsorted(above, k)), int(min_score * SCORE_LEVELS))
+        # Recipes sharing no ingredient sit at level 0 too; leave them out so a selection
+        # matching fewer than k recipes does not sort the whole collection
+        candidates = np.flatnonzero((levels >= cutoff) & (counts > 0))
+        order = np.lexsort((-counts[candidates].astype(np.int32), -scores[candidates]))
+        best = candidates[order[:k]]
+        return [(self.title(i), float(scores[i]), int(counts[i])) for i in best if scores[i] >= min_score]
+
+    def top_k_batch(self, selections, k=10, metric="coverage", min_score=0.0):
+        # Score several selections; results are in input order
+        return [self.top_k(selection, k, metric, min_score) for selection in selections]
+
+    def recommend(self, selection, k=5, min_coverage=0.0):
+        # Same interface as recommender.RecipeRecommender.recommend
+        return self.top_k(selection, k, "coverage", min_coverage)
+
+    def save(self, path):
+        """
+        Write the matrix to a directory of .npy files that load() can memory-map.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.names, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a matrix saved with save(). With mmap=True the arrays are
+        memory-mapped read-only, so processes share the page cache copy.
+        """
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in _ARRAYS}
+        with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        return cls(vocabulary=vocabulary, **arrays)
+
+def benchmark(n_recipes=1_000_000, n_ingredients=50_000, queries=1000, metric="coverage", seed=0):
+    """
+    Score random selections against a synthetic matrix whose ingredient
+    popularity follows a 1/rank (Zipf) law and report latency percentiles
+    in milliseconds.
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, n_ingredients + 1)
+    popularity /= popularity.sum()
+    sizes = rng.integers(4, 15, n_recipes)
+    ingredient_ids = rng.choice(n_ingredients, sizes.sum(), p=popularity)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    names = [f"ingredient {i}" for i in range(n_ingredients)]
+    records = ((f"recipe {r}", [names[i] for i in ingredient_ids[offsets[r]:offsets[r + 1]]])
+               for r in range(n_recipes))
+    started = time.perf_counter()
+    matrix = RecipeMatrix.from_records(records)
+    build_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(queries):
+        selection = [names[i] for i in rng.choice(n_ingredients, rng.integers(3, 12), p=popularity)]
+        started = time.perf_counter()
+        matrix.top_k(selection, k=10, metric=metric)
+        latencies.append((time.perf_counter() - started) * 1000)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    logger.info("Built %d recipes in %.1fs; %s top-10 p50 %.2f ms, p99 %.2f ms",
+                n_recipes, build_seconds, metric, p50, p99)
+    return {"build_seconds": build_seconds, "p50_ms": float(p50), "p99_ms": float(p99)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or benchmark the recipe x ingredient matrix")
+    parser.add_argument("--build", metavar="DIR", help="Build from the recipe CSV's NER column into DIR")
+    parser.add_argument("--path", default="receipes.csv", help="Recipe CSV used with --build")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark scoring on N synthetic recipes")
+    parser.add_argument("--metric", choices=METRICS, default="coverage")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.build:
+        RecipeMatrix.from_records(recipe_sets_from_csv(args.path)).save(args.build)
+    if args.benchmark:
+        benchmark(args.benchmark, metric=args.metric)
@@ -0,0 +1,107 @@
+# recommender.py
+
+import heapq
+import logging
+import os
+import threading
+from collections import defaultdict
+from data_processing import parse_json_list
+from ingredient_parser import normalize_name
+from preprocessing import iter_csv_chunks, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Minimum share of a stored recipe's ingredients the selection must cover
+# before it is served instead of asking the LLM
+MIN_COVERAGE = float(os.getenv("RECOMMENDER_MIN_COVERAGE", "0.75"))
+
+class RecipeRecommender:
+    """
+    In-memory inverted index from ingredient name to recipe ids, used to
+    rank stored recipes by how much of each recipe the user's selection
+    covers.
+    """
+
+    def __init__(self):
+        self._ids = {}           # title -> recipe id
+        self._titles = []        # recipe id -> title
+        self._ingredients = []   # recipe id -> frozenset of normalized names
+        self._index = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_recipe(self, title, ingredient_names):
+        """
+        Add a recipe, or replace the ingredients of one with the same title.
+        Args:
+            title (str): Recipe title
+            ingredient_names (iterable): Names of the recipe's ingredients
+        """
+        names = frozenset(normalize_name(name) for name in ingredient_names if name)
+        if not title or not names:
+            return
+        with self._lock:
+            recipe_id = self._ids.get(title)
+            if recipe_id is None:
+                recipe_id = len(self._titles)
+                self._ids[title] = recipe_id
+                self._titles.append(title)
+                self._ingredients.append(names)
+            else:
+                for name in self._ingredients[recipe_id] - names:
+                    self._index[name].discard(recipe_id)
+                self._ingredients[recipe_id] = names
+            for name in names:
+                self._index[name].add(recipe_id)
+
+    def add_rows(self, rows):
+        # Write listener for knowledge_graph: rows of {'title', 'ingredients', 'directions'}
+        for row in rows:
+            self.add_recipe(row["title"], [ing["ingredient"] for ing in row["ingredients"]])
+
+    def recommend(self, selection, k=5, min_coverage=MIN_COVERAGE):
+        """
+        Rank stored recipes by ingredient coverage.
+        Args:
+            selection (iterable): Ingredient names the user has
+            k (int): Maximum number of recipes returned
+            min_coverage (float): Minimum share of a recipe's ingredients
+                that must be in the selection
+        Returns:
+            list: (title, coverage, matched ingredient count) tuples, best first
+        """
+        selected = {normalize_name(name) for name in selection if name}
+        with self._lock:
+            matches = defaultdict(int)
+            for name in selected:
+                for recipe_id in self._index.get(name, ()):
+                    matches[recipe_id] += 1
+            scored = (
+                (count / len(self._ingredients[recipe_id]), count, recipe_id)
+                for recipe_id, count in matches.items()
+            )
+            best = heapq.nlargest(k, (item for item in scored if item[0] >= min_coverage))
+            return [(self._titles[recipe_id], coverage, count) for coverage, count, recipe_id in best]
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build an index from (title, ingredient names) pairs, e.g.
+        knowledge_graph.iter_recipe_ingredient_sets() or recipe_sets_from_csv().
+        """
+        recommender = cls()
+        for title, names in records:
+            recommender.add_recipe(title, names)
+        logger.info("Recommender index built with %d recipes", len(recommender))
+        return recommender
+
+def recipe_sets_from_csv(path, chunksize=CHUNK_SIZE):
+    # (title, NER ingredient names) pairs streamed from a receipes.csv-format file
+    for chunk in iter_csv_chunks(path, chunksize):
+        for title, ner in zip(chunk['title'], chunk['NER']):
+            try:
+                yield title, parse_json_list(ner)
+            except ValueError:
+                continue
@@ -0,0 +1,152 @@
+# single_flight.py
+
+import contextvars
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class _Stream:
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.pieces = []
+        self.finished = False
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs the
+    function, later callers with that key wait for it and share its result
+    (or its exception). Nothing is cached once the call has finished.
+    stream() does the same for generators: every caller receives all pieces
+    of one in-flight stream.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless a call with the same key is in flight.
+        Args:
+            key (hashable): Identity of the computation, e.g. a normalized ingredient set
+            fn (callable): Computation to run
+        Returns:
+            The result of fn, from this call or the one in flight
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._in_flight[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            logger.debug("%s: waiting on in-flight call for %r", self.name, key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+            if call.waiters:
+                logger.info("%s: %d request(s) shared one call for %r", self.name, call.waiters, key)
+
+    def stream(self, key, fn, *args, **kwargs):
+        """
+        Generator version of do(): iterate fn(*args, **kwargs) unless a stream
+        with the same key is in flight. The source is drained by a background
+        thread into a shared buffer, so a caller that joins late first gets the
+        pieces produced so far, and a caller that stops early does not stop
+        the stream for the others.
+        Args:
+            key (hashable): Identity of the computation, e.g. a normalized ingredient set
+            fn (callable): Function returning an iterable of pieces
+        Yields:
+            The pieces of fn's stream, in order
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._streams.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._streams[key] = _Stream()
+                leader = True
+                self.executions += 1
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, args=(self._produce, key, call, fn, args, kwargs),
+                                 name=f"{self.name} stream", daemon=True).start()
+        if not leader:
+            logger.debug("%s: joining in-flight stream for %r", self.name, key)
+
+        position = 0
+        while True:
+            with call.changed:
+                while position == len(call.pieces) and not call.finished:
+                    call.changed.wait()
+                pieces = call.pieces[position:]
+                finished = call.finished
+            yield from pieces
+            position += len(pieces)
+            if finished:
+                if call.error is not None:
+                    raise call.error
+                return
+
+    def _produce(self, key, call, fn, args, kwargs):
+        # Drain one stream into its buffer, waking the callers reading it
+        try:
+            for piece in fn(*args, **kwargs):
+                with call.changed:
+                    call.pieces.append(piece)
+                    call.changed.notify_all()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with call.changed:
+                call.finished = True
+                call.changed.notify_all()
+            if call.waiters:
+                logger.info("%s: %d request(s) shared one stream for %r", self.name, call.waiters, key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight) + len(self._streams),
+            }
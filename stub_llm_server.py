@@ -0,0 +1,188 @@
+# stub_llm_server.py
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Recipe returned for every chat completion request
+DEFAULT_RECIPE = {
+    "title": "Stub Recipe",
+    "Ingredients": [
+        {"quantity": "1 cup", "ingredient": "flour"},
+        {"quantity": "2", "ingredient": "eggs"},
+    ],
+    "directions": ["Mix the ingredients.", "Bake for 20 minutes."],
+    "tips": "Serve warm.",
+}
+
+# Ingredient list at the end of the recipe prompt built by app.build_recipe_request
+_PROMPT_INGREDIENTS = re.compile(r"ingredients:\s*(.+?)\.?\s*$", re.IGNORECASE | re.DOTALL)
+
+def echo_recipe(request):
+    """
+    Build a recipe from the ingredients named in the last user message, so
+    different ingredient sets get different titles (and graph writes).
+    Args:
+        request (dict): Chat completion request body
+    Returns:
+        dict: Recipe in the app's JSON schema
+    """
+    prompt = next((message.get("content", "") for message in reversed(request.get("messages", []))
+                   if message.get("role") == "user"), "")
+    match = _PROMPT_INGREDIENTS.search(prompt)
+    names = [name.strip() for name in match.group(1).split(",") if name.strip()] if match else []
+    if not names:
+        return DEFAULT_RECIPE
+    return {
+        "title": " ".join(name.title() for name in names[:3]) + " Bake",
+        "Ingredients": [{"quantity": "1 cup", "ingredient": name} for name in names],
+        "directions": [f"Prepare the {name}." for name in names] + ["Bake for 20 minutes."],
+        "tips": "Serve warm.",
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible /chat/completions endpoint. Latency, error
+    rate and the canned response are read from the server object.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": "not found"}})
+
+        time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            return self._send(random.choice([429, 500, 503]),
+                              {"error": {"message": "injected failure"}},
+                              headers={"Retry-After": "0"})
+
+        content = json.dumps(server.response_for(request))
+        if request.get("stream"):
+            return self._stream(content, request.get("model", "stub"))
+        return self._send(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _stream(self, content, model):
+        # Server-sent events with a few characters of content per chunk, like token streaming
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = [content[i:i + server.chunk_chars] for i in range(0, len(content), server.chunk_chars)]
+        for index, piece in enumerate(pieces + [None]):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": piece} if piece is not None else {},
+                    "finish_reason": None if piece is not None else "stop",
+                }],
+            }
+            if index and server.chunk_delay:
+                time.sleep(server.chunk_delay)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, response=None, chunk_delay=0.0, chunk_chars=4,
+                 echo=False):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.response = response or DEFAULT_RECIPE
+        self.echo = echo
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = chunk_chars
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def response_for(self, request):
+        return echo_recipe(request) if self.echo else self.response
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, response=None, chunk_delay=0.0,
+                      echo=False):
+    """
+    Start a stub server on a background thread.
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind; 0 picks a free port
+        latency (float): Seconds to wait before answering each request
+        error_rate (float): Fraction of requests answered with 429/500/503
+        response (dict): JSON object returned as the completion content
+        chunk_delay (float): Seconds between chunks of a streamed response
+        echo (bool): Build each response from the prompt's ingredients instead of returning response
+    Returns:
+        StubLLMServer: The running server; use base_url as KOLANK_URL and shutdown() to stop it
+    """
+    server = StubLLMServer((host, port), latency, error_rate, response, chunk_delay, echo=echo)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 429/5xx responses")
+    parser.add_argument("--chunk-delay", type=float, default=0.0,
+                        help="Seconds between chunks of streamed responses")
+    parser.add_argument("--echo", action="store_true",
+                        help="Answer with a recipe built from the ingredients in the prompt")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubLLMServer((args.host, args.port), args.latency, args.error_rate, chunk_delay=args.chunk_delay,
+                           echo=args.echo)
+    logger.info("Stub LLM server listening on %s", server.base_url)
+    server.serve_forever()
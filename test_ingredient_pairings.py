@@ -0,0 +1,83 @@
+# test_ingredient_pairings.py
+
+from ingredient_pairings import PairingIndex
+
+def _records():
+    # Four recipes with salt and basil, plus twenty that share tomato and garlic
+    records = [(f"pesto {i}", ["Salt", "basil", f"extra {i}"]) for i in range(4)]
+    records += [(f"sauce {i}", ["tomato", "garlic"]) for i in range(20)]
+    return records
+
+def test_from_records_counts_recipes_and_pairs():
+    index = PairingIndex.from_records(_records(), min_count=5)
+    assert index.recipes == 24
+    assert [(partner, count) for partner, _, count in index.pairings("Tomato")] == [("garlic", 20)]
+    # Salt and basil share four recipes, below min_count
+    assert index.pairings("salt") == []
+
+def test_add_recipes_builds_on_pairs_below_min_count():
+    index = PairingIndex.from_records(_records(), min_count=5)
+    index.add_recipes([("pesto 4", ["salt", "basil"])])
+    assert [(partner, count) for partner, _, count in index.pairings("salt")] == [("basil", 5)]
+    # Names come back spelled as first seen, whatever the case of the lookup
+    assert index.suggest(["BASIL"]) == ["Salt"]
+
+def test_add_recipes_counts_new_ingredients():
+    index = PairingIndex(min_count=1)
+    index.add_recipes([("porridge", ["oats", "milk"]), ("granola", ["oats", "honey"]),
+                       ("muesli", ["oats", "milk"])])
+    assert index.recipes == 3
+    assert {partner: count for partner, _, count in index.pairings("oats")} == {"milk": 2, "honey": 1}
+
+def test_pairing_rows_keep_the_stored_spelling(tmp_path):
+    index = PairingIndex.from_records(_records(), min_count=5)
+    index.add_recipes([("pesto 4", ["SALT", "Basil"])])
+    index.save(tmp_path)
+    for loaded in (index, PairingIndex.load(tmp_path)):
+        rows = {row["ingredient"]: row["pairs"] for row in loaded.pairing_rows()}
+        assert [pair["partner"] for pair in rows["Salt"]] == ["basil"]
+
+def test_load_restores_saved_and_added_counts(tmp_path):
+    index = PairingIndex.from_records(_records(), min_count=5)
+    index.add_recipes([("pesto 4", ["salt", "basil"])])
+    assert index.unsaved
+    index.save(tmp_path)
+    assert not index.unsaved
+
+    loaded = PairingIndex.load(tmp_path)
+    assert loaded.recipes == 25
+    assert loaded.min_count == 5
+    assert loaded.pairings("salt") == index.pairings("salt")
+    assert loaded.pairings("garlic") == index.pairings("garlic")
+
+    # Counting continues on top of the memory-mapped arrays and survives another save
+    loaded.add_recipes([("pesto 5", ["salt", "basil"])])
+    loaded.save(tmp_path)
+    assert PairingIndex.load(tmp_path).pairings("basil")[0][2] == 6
+
+def test_rewriting_a_title_replaces_its_counts(tmp_path):
+    index = PairingIndex.from_records(_records(), min_count=5)
+    index.add_recipes([("pesto 4", ["salt", "basil"])])
+    # Writing the same recipe again changes nothing
+    index.add_recipes([("pesto 4", ["Salt", "basil"])])
+    assert index.recipes == 25
+    assert index.pairings("salt")[0][2] == 5
+
+    # Rewriting it with other ingredients moves its counts
+    index.add_recipes([("pesto 4", ["salt", "garlic"])])
+    assert index.recipes == 25
+    assert index.pairings("basil") == []
+    assert {partner: count for partner, _, count in index.pairings("garlic")} == {"tomato": 20}
+
+    # The counted sets survive save/load, so a full resync of the same rows adds nothing
+    index.save(tmp_path)
+    loaded = PairingIndex.load(tmp_path)
+    loaded.add_recipes(_records())
+    loaded.add_recipes([("pesto 4", ["salt", "garlic"])])
+    assert loaded.recipes == 25
+    assert loaded.pairings("tomato") == index.pairings("tomato")
+
+def test_from_records_counts_the_last_row_of_a_repeated_title():
+    index = PairingIndex.from_records(_records() + [("sauce 0", ["tomato", "basil"])], min_count=1)
+    assert index.recipes == 24
+    assert {partner: count for partner, _, count in index.pairings("tomato")} == {"garlic": 19, "basil": 1}
@@ -0,0 +1,71 @@
+# vocabulary.py
+
+import argparse
+import gzip
+import logging
+import os
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Prebuilt ingredient vocabulary read by the app at startup
+VOCAB_PATH = os.getenv("INGREDIENT_VOCAB_PATH", "ingredient_vocab.tsv.gz")
+
+def save_vocabulary(counts, path=VOCAB_PATH):
+    """
+    Write an ingredient vocabulary snapshot: one "name<TAB>recipe count"
+    line per ingredient, sorted by name, gzip-compressed. The file is
+    written next to the target and renamed so readers never see a
+    partial snapshot.
+    Args:
+        counts (dict): Ingredient name -> number of recipes using it
+        path (str): Snapshot file
+    """
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        for name in sorted(counts):
+            clean = name.replace("\t", " ").replace("\n", " ").strip()
+            if clean:
+                f.write(f"{clean}\t{int(counts[name])}\n")
+    os.replace(tmp_path, path)
+    logger.info("Wrote %d ingredients to %s", len(counts), path)
+
+def load_vocabulary(path=VOCAB_PATH):
+    """
+    Read a snapshot written by save_vocabulary.
+    Returns:
+        dict: Ingredient name -> recipe count, in name order
+    """
+    with gzip.open(path, "rb") as f:
+        lines = f.read().decode("utf-8").splitlines()
+    fields = (line.rpartition("\t") for line in lines)
+    return {name: int(count) for name, _, count in fields}
+
+def vocabulary_from_csv(path, chunksize=None):
+    # Recipe counts of the canonical ingredient names the ingest writes to the graph
+    from preprocessing import iter_recipe_records, CHUNK_SIZE
+
+    counts = Counter()
+    for record in iter_recipe_records(path, chunksize or CHUNK_SIZE):
+        counts.update({ingredient["ingredient"] for ingredient in record["ingredients"]})
+    return counts
+
+def vocabulary_from_graph():
+    # Recipe counts of every Ingredient node, including ones not used by any recipe yet
+    from knowledge_graph import get_ingredient_counts
+
+    return get_ingredient_counts()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the ingredient vocabulary snapshot used at app startup")
+    parser.add_argument("--source", choices=["csv", "graph"], default="csv")
+    parser.add_argument("--path", default="receipes.csv", help="Recipe CSV (with --source csv)")
+    parser.add_argument("--out", default=VOCAB_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    counts = vocabulary_from_csv(args.path) if args.source == "csv" else vocabulary_from_graph()
+    save_vocabulary(counts, args.out)
+    logger.info("Snapshot built in %.2fs", time.perf_counter() - started)